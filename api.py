@@ -1,9 +1,21 @@
 from flask import Blueprint, jsonify, request, current_app, send_from_directory
-from models import db, User, Generation
+from models import db, User, Generation, GenerationJob, GenerationBatch
+import queries
 from auth import api_key_required
+from api_key_cache import get_api_key_cache
+from jobs import submit_generation_job, submit_generation_batch
+from artifacts import send_artifact, counts_as_download
+from compression import compress_response
+from content_cache import get_generation_content, get_content_cache
+from counters import count_view, count_download, current_count, get_counter_buffer
+from rate_limit import get_rate_limiter
+from durability import get_write_stats
+from retention import get_retention_stats
 from generator import YouTubeShortsGenerator
-from prompts import get_image_prompt_dict
-from llm_integration import call_llm_gorq
+from scene_parser import get_scene_dict, get_scene_parser_stats
+from llm_cache import get_llm_cache
+from llm_router import get_llm_router
+from tts_cache import get_audio_store
 import os
 import logging
 import json
@@ -12,12 +24,29 @@ from datetime import datetime
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
 logger = logging.getLogger(__name__)
 
+@api_bp.after_request
+def compress_json(response):
+    """Compress JSON responses above API_COMPRESS_MIN_SIZE for clients that accept it"""
+    if response.mimetype != 'application/json':
+        return response
+    return compress_response(response, request.accept_encodings, current_app.config['API_COMPRESS_MIN_SIZE'])
+
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """Basic API health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'llm_cache': get_llm_cache().stats(),
+        'scene_parser': get_scene_parser_stats(),
+        'tts_cache': get_audio_store().stats(),
+        'llm_router': get_llm_router().stats(),
+        'content_cache': get_content_cache().stats(),
+        'writes': get_write_stats(),
+        'retention': get_retention_stats(),
+        'counters': get_counter_buffer().stats(),
+        'rate_limiter': get_rate_limiter().stats(),
+        'api_key_cache': get_api_key_cache().stats()
     })
 
 @api_bp.route('/generate', methods=['POST'])
@@ -42,27 +71,41 @@ def generate_content(user):
                 'message': 'Country name is required'
             }), 400
         
+        # Opt-in asynchronous mode: queue the job and return immediately
+        if data.get('async') or request.args.get('async', type=int):
+            job = submit_generation_job(user, country)
+            if job is None:
+                # Concurrent submissions used up the quota since the check above
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Monthly generation limit reached for your {user.subscription_tier} plan'
+                }), 403
+            response = jsonify({
+                'status': 'accepted',
+                'job_id': job.job_id,
+                'status_url': f'/api/v1/jobs/{job.job_id}'
+            })
+            response.headers['Location'] = f'/api/v1/jobs/{job.job_id}'
+            return response, 202
+        
         # Initialize generator
-        generator = YouTubeShortsGenerator()
+        generator = YouTubeShortsGenerator(current_app.config['OUTPUT_FOLDER'])
         generator.set_country(country)
         
         # Generate all outputs
         results = generator.generate_all()
         
-        # Generate scene image prompts
+        # Convert scene prompts to the scene dictionary (parsed locally, LLM only as a fallback)
         try:
-            scene_prompts = call_llm_gorq(get_image_prompt_dict(results["scenes"]))
-            if "Error" in scene_prompts:
-                logger.warning("LLM returned an error for scene generation")
-                scene_prompts = "Scene generation failed."
-            results["scenes"] = scene_prompts
-        except Exception as e:
-            logger.exception("Error generating scenes via LLM:")
-            results["scenes"] = "Scene generation error."
+            results["scenes"] = json.dumps(get_scene_dict(results["scenes"]), indent=2, ensure_ascii=False)
+        except ValueError:
+            logger.exception("Error converting scene prompts:")
+            results["scenes"] = "Scene generation failed."
         
         # Save outputs
         try:
-            file_paths = generator.save_outputs(current_app.config['OUTPUT_FOLDER'])
+            file_paths = generator.save_outputs(current_app.config['OUTPUT_FOLDER'],
+                                               bundle=current_app.config['ZIP_BUNDLE_MODE'] == 'precompute')
         except Exception as e:
             logger.exception("Error saving generated outputs:")
             return jsonify({
@@ -109,6 +152,115 @@ def generate_content(user):
             'message': str(e)
         }), 500
 
+@api_bp.route('/generate/batch', methods=['POST'])
+@api_key_required
+def generate_batch(user):
+    """Queue YouTube Shorts generations for many countries at once"""
+    try:
+        data = request.get_json(force=True)
+        countries = data.get('countries')
+        
+        if not isinstance(countries, list):
+            return jsonify({
+                'status': 'error',
+                'message': 'A list of countries is required'
+            }), 400
+        
+        # Drop blanks and duplicates, keeping the requested order
+        unique_countries = []
+        seen = set()
+        for country in countries:
+            country = str(country).strip()
+            if country and country.lower() not in seen:
+                seen.add(country.lower())
+                unique_countries.append(country)
+        
+        if not unique_countries:
+            return jsonify({
+                'status': 'error',
+                'message': 'A list of countries is required'
+            }), 400
+        
+        max_items = current_app.config.get('BATCH_MAX_ITEMS', 50)
+        if len(unique_countries) > max_items:
+            return jsonify({
+                'status': 'error',
+                'message': f'A batch may contain at most {max_items} countries'
+            }), 400
+        
+        # Single quota check for the whole batch, made in the same update that reserves it
+        submitted = submit_generation_batch(user, unique_countries)
+        if submitted is None:
+            return jsonify({
+                'status': 'error',
+                'message': f'Batch of {len(unique_countries)} exceeds the {user.remaining_generations()} generations '
+                           f'left this month on your {user.subscription_tier} plan'
+            }), 403
+        batch, jobs = submitted
+        
+        response = jsonify({
+            'status': 'accepted',
+            'batch_id': batch.batch_id,
+            'status_url': f'/api/v1/batches/{batch.batch_id}',
+            'jobs': [{'job_id': job.job_id, 'country': job.country} for job in jobs]
+        })
+        response.headers['Location'] = f'/api/v1/batches/{batch.batch_id}'
+        return response, 202
+        
+    except Exception as e:
+        logger.exception("Error in API batch generate endpoint:")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@api_bp.route('/batches/<batch_id>', methods=['GET'])
+@api_key_required
+def get_batch(user, batch_id):
+    """Get the state of a batch and the results of each of its items"""
+    batch = GenerationBatch.query.filter_by(batch_id=batch_id, user_id=user.id).first()
+    
+    if not batch:
+        return jsonify({
+            'status': 'error',
+            'message': 'Batch not found'
+        }), 404
+    
+    items = [job.to_dict() for job in batch.jobs]
+    counts = {}
+    for item in items:
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+    
+    return jsonify({
+        'status': 'success',
+        'batch': {
+            'batch_id': batch.batch_id,
+            'status': batch.status,
+            'total': batch.total,
+            'counts': counts,
+            'created_at': batch.created_at.isoformat(),
+            'finished_at': batch.finished_at.isoformat() if batch.finished_at else None,
+            'items': items
+        }
+    })
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+@api_key_required
+def get_job(user, job_id):
+    """Get the state, per-stage progress and output paths of an asynchronous generation job"""
+    job = GenerationJob.query.filter_by(job_id=job_id, user_id=user.id).first()
+    
+    if not job:
+        return jsonify({
+            'status': 'error',
+            'message': 'Job not found'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'job': job.to_dict()
+    })
+
 @api_bp.route('/generations', methods=['GET'])
 @api_key_required
 def list_generations(user):
@@ -125,29 +277,9 @@ def list_generations(user):
         date_from = request.args.get('date_from', '')
         date_to = request.args.get('date_to', '')
         
-        # Build query
-        query = Generation.query.filter_by(user_id=user.id)
-        
-        if country:
-            query = query.filter(Generation.country.ilike(f'%{country}%'))
-        
-        if date_from:
-            try:
-                date_from_obj = datetime.strptime(date_from, '%Y-%m-%d')
-                query = query.filter(Generation.timestamp >= date_from_obj)
-            except ValueError:
-                pass
-        
-        if date_to:
-            try:
-                date_to_obj = datetime.strptime(date_to, '%Y-%m-%d')
-                date_to_obj = date_to_obj.replace(hour=23, minute=59, second=59)
-                query = query.filter(Generation.timestamp <= date_to_obj)
-            except ValueError:
-                pass
-        
         # Execute query with pagination
-        pagination = query.order_by(Generation.timestamp.desc()).paginate(page=page, per_page=per_page)
+        pagination = queries.generation_listing(user.id, country, date_from, date_to)\
+            .paginate(page=page, per_page=per_page)
         
         # Format results
         generations = []
@@ -157,8 +289,8 @@ def list_generations(user):
                 'generation_id': generation.generation_id,
                 'country': generation.country,
                 'timestamp': generation.timestamp.isoformat(),
-                'view_count': generation.view_count,
-                'download_count': generation.download_count,
+                'view_count': current_count(generation, 'view_count'),
+                'download_count': current_count(generation, 'download_count'),
                 'files': {
                     'story_path': generation.story_path,
                     'voiceover_path': generation.voiceover_path,
@@ -188,10 +320,7 @@ def list_generations(user):
 def get_generation(user, generation_id):
     """Get details for a specific generation"""
     try:
-        generation = Generation.query.filter_by(
-            generation_id=generation_id,
-            user_id=user.id
-        ).first()
+        generation = queries.user_generation(user.id, generation_id).first()
         
         if not generation:
             return jsonify({
@@ -199,26 +328,12 @@ def get_generation(user, generation_id):
                 'message': 'Generation not found'
             }), 404
         
-        # Increment view count
-        generation.view_count += 1
-        db.session.commit()
-        
-        # Load content files
-        content = {}
-        base_dir = os.path.join('static', 'outputs', generation.generation_id)
+        # Increment view count (buffered, written in bulk by the counter flush)
+        count_view(generation)
         
+        # Load content (packed file, or loose files for older generations)
         try:
-            with open(os.path.join(base_dir, 'story.txt'), 'r', encoding='utf-8') as f:
-                content['story'] = f.read()
-            
-            with open(os.path.join(base_dir, 'voiceover.txt'), 'r', encoding='utf-8') as f:
-                content['voiceover'] = f.read()
-            
-            with open(os.path.join(base_dir, 'scenes.txt'), 'r', encoding='utf-8') as f:
-                content['scenes'] = f.read()
-            
-            with open(os.path.join(base_dir, 'metadata.json'), 'r', encoding='utf-8') as f:
-                content['metadata'] = json.load(f)
+            content = get_generation_content(generation.generation_id)
         except Exception as e:
             logger.exception("Error loading content files:")
             content = {
@@ -235,8 +350,8 @@ def get_generation(user, generation_id):
                 'generation_id': generation.generation_id,
                 'country': generation.country,
                 'timestamp': generation.timestamp.isoformat(),
-                'view_count': generation.view_count,
-                'download_count': generation.download_count,
+                'view_count': current_count(generation, 'view_count'),
+                'download_count': current_count(generation, 'download_count'),
                 'files': {
                     'story_path': generation.story_path,
                     'voiceover_path': generation.voiceover_path,
@@ -258,10 +373,7 @@ def get_generation(user, generation_id):
 @api_key_required
 def download_file(user, generation_id, file_type):
     """Download files associated with a generation"""
-    generation = Generation.query.filter_by(
-        generation_id=generation_id,
-        user_id=user.id
-    ).first()
+    generation = queries.user_generation(user.id, generation_id).first()
     
     if not generation:
         return jsonify({
@@ -269,12 +381,12 @@ def download_file(user, generation_id, file_type):
             'message': 'Generation not found'
         }), 404
     
-    # Map file types to file paths
+    # Map file types to artifact names
     file_paths = {
-        'story': ('story.txt', os.path.join('outputs', generation_id, 'story.txt')),
-        'voiceover': ('voiceover.txt', os.path.join('outputs', generation_id, 'voiceover.txt')),
-        'audio': ('voiceover_tts.mp3', os.path.join('outputs', generation_id, 'voiceover_tts.mp3')),
-        'scenes': ('scenes.txt', os.path.join('outputs', generation_id, 'scenes.txt'))
+        'story': 'story.txt',
+        'voiceover': 'voiceover.txt',
+        'audio': 'voiceover_tts.mp3',
+        'scenes': 'scenes.txt'
     }
     
     if file_type not in file_paths:
@@ -283,25 +395,20 @@ def download_file(user, generation_id, file_type):
             'message': 'Invalid file type requested'
         }), 400
     
-    # Increment download count
-    generation.download_count += 1
-    db.session.commit()
-    
-    filename, path = file_paths[file_type]
-    
     try:
-        return send_from_directory(
-            current_app.config['OUTPUT_FOLDER'],
-            path,
-            download_name=filename,
-            as_attachment=True
-        )
+        response = send_artifact(generation_id, file_paths[file_type])
+        if response is not None:
+            # Count downloads, not cache revalidations or resumed transfers
+            if counts_as_download(response):
+                count_download(generation)
+            return response
     except Exception as e:
         logger.exception("Error downloading file:")
-        return jsonify({
-            'status': 'error',
-            'message': 'File not found'
-        }), 404
+    
+    return jsonify({
+        'status': 'error',
+        'message': 'File not found'
+    }), 404
 
 @api_bp.route('/user/usage', methods=['GET'])
 @api_key_required
@@ -316,14 +423,11 @@ def get_usage(user):
         }
         
         limit = plan_limits.get(user.subscription_tier, 0)
-        usage_percent = (user.monthly_generations / limit * 100) if limit != float('inf') else 0
+        usage_percent = (user.generations_this_month() / limit * 100) if limit != float('inf') else 0
         
         # Get counts of generations
         month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        month_generations_count = Generation.query.filter(
-            Generation.user_id == user.id,
-            Generation.timestamp >= month_start
-        ).count()
+        month_generations_count = queries.generations_since(user.id, month_start).count()
         
         return jsonify({
             'status': 'success',
@@ -331,9 +435,9 @@ def get_usage(user):
                 'subscription_tier': user.subscription_tier,
                 'subscription_status': user.subscription_status,
                 'monthly_limit': 'Unlimited' if limit == float('inf') else limit,
-                'monthly_used': user.monthly_generations,
+                'monthly_used': user.generations_this_month(),
                 'usage_percent': usage_percent,
-                'remaining': 'Unlimited' if limit == float('inf') else (limit - user.monthly_generations),
+                'remaining': 'Unlimited' if limit == float('inf') else (limit - user.generations_this_month()),
                 'total_generations': user.total_generations,
                 'month_generations': month_generations_count
             }
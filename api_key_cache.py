@@ -0,0 +1,216 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import select, update
+
+from models import db, User, CacheVersion
+import queries
+
+logger = logging.getLogger(__name__)
+
+# CacheVersion row shared by every process's API key cache
+CACHE_VERSION_NAME = 'api_keys'
+
+ResolvedKey = namedtuple('ResolvedKey', 'key_id user_id subscription_tier subscription_status')
+
+
+def _key_hash(api_key: str) -> str:
+    # Raw keys are never held in memory longer than the request that carried them
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+class ApiKeyCache:
+    """
+    Bounded LRU cache of active API keys resolved to their owner's id, tier and status.
+
+    Entries expire after ttl seconds. Deactivating a key or changing a user's
+    subscription invalidates the affected entries at once in this process and bumps
+    a version shared through the database; every process compares that version on
+    each lookup and drops all of its entries when it changed.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.epoch = 0  # Bumped by every invalidation
+        self.shared_version = None  # Last CacheVersion seen
+        self._entries = OrderedDict()  # key hash -> (ResolvedKey, expiry)
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str):
+        """Cached resolution of a key, or None on a miss."""
+        digest = _key_hash(api_key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, api_key: str, resolved: ResolvedKey, epoch: int) -> None:
+        """Store a resolution read from the database while the cache was at epoch."""
+        digest = _key_hash(api_key)
+        with self._lock:
+            if epoch != self.epoch:
+                # Invalidated while it was being read; it may already be stale
+                return
+            self._entries[digest] = (resolved, time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def sync(self, shared_version: int) -> None:
+        """Drop every entry if another process invalidated keys since the last lookup."""
+        with self._lock:
+            if shared_version == self.shared_version:
+                return
+            self.epoch += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.shared_version = shared_version
+
+    def invalidate_key(self, api_key: str) -> None:
+        """Drop one key, e.g. after it was deactivated."""
+        with self._lock:
+            self.epoch += 1
+            if self._entries.pop(_key_hash(api_key), None) is not None:
+                self.invalidations += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every key of a user, e.g. after their subscription tier or status changed."""
+        with self._lock:
+            self.epoch += 1
+            stale = [digest for digest, (resolved, _) in self._entries.items() if resolved.user_id == user_id]
+            for digest in stale:
+                del self._entries[digest]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "shared_version": self.shared_version,
+                "max_entries": self.max_entries,
+                "ttl": self.ttl
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_api_key_cache() -> ApiKeyCache:
+    """Return the process-wide API key cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ApiKeyCache(int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", 10000)),
+                                     float(os.getenv("API_KEY_CACHE_TTL", 60)))
+    return _cache
+
+
+def _publish_invalidation() -> None:
+    """Bump the shared cache version, so every process drops its cached keys."""
+    try:
+        db.session.execute(update(CacheVersion)
+                           .where(CacheVersion.name == CACHE_VERSION_NAME)
+                           .values(version=CacheVersion.version + 1))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        logger.exception("Failed to publish API key cache invalidation; other processes keep entries until they expire")
+
+
+def invalidate_api_key(api_key: str) -> None:
+    """Drop a key from the cache of every process, e.g. after it was deactivated. Call after committing."""
+    _publish_invalidation()
+    get_api_key_cache().invalidate_key(api_key)
+
+
+def invalidate_user_keys(user_id: int) -> None:
+    """Drop every key of a user from the cache of every process, e.g. after a subscription change. Call after committing."""
+    _publish_invalidation()
+    get_api_key_cache().invalidate_user(user_id)
+
+
+def resolve_api_key(api_key: str):
+    """
+    Resolve an active API key to its owner, from the cache or with one joined query.
+
+    Returns:
+        ResolvedKey: Or None if the key does not exist or is inactive.
+    """
+    cache = get_api_key_cache()
+    # One primary key lookup; far cheaper than the joined query it saves
+    shared_version = db.session.execute(
+        select(CacheVersion.version).where(CacheVersion.name == CACHE_VERSION_NAME)
+    ).scalar()
+    cache.sync(shared_version or 0)
+    resolved = cache.get(api_key)
+    if resolved is not None:
+        return resolved
+
+    epoch = cache.epoch
+    row = queries.active_api_key_owner(api_key).first()
+    if row is None:
+        return None
+    resolved = ResolvedKey(*row)
+    cache.put(api_key, resolved, epoch)
+    return resolved
+
+
+class ApiUser:
+    """
+    The user of a resolved API key, handed to API handlers in place of a User.
+
+    id, subscription_tier and subscription_status come from the cache. Any other
+    attribute or method loads the User row on first use and is delegated to it,
+    so handlers that only need the id never touch the database.
+    """
+
+    def __init__(self, resolved: ResolvedKey):
+        object.__setattr__(self, '_resolved', resolved)
+        object.__setattr__(self, '_user', None)
+
+    def _load(self) -> User:
+        if self._user is None:
+            user = db.session.get(User, self._resolved.user_id)
+            if user is None:
+                raise LookupError(f"User {self._resolved.user_id} of an API key no longer exists")
+            object.__setattr__(self, '_user', user)
+        return self._user
+
+    @property
+    def id(self):
+        return self._resolved.user_id
+
+    @property
+    def subscription_tier(self):
+        return self._user.subscription_tier if self._user is not None else self._resolved.subscription_tier
+
+    @property
+    def subscription_status(self):
+        return self._user.subscription_status if self._user is not None else self._resolved.subscription_status
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
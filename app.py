@@ -1,23 +1,33 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, redirect, url_for, flash, stream_with_context
 from flask_login import LoginManager, current_user
+import click
 import logging
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from apscheduler.schedulers.background import BackgroundScheduler
 
 # Import modules from original application
 from generator import YouTubeShortsGenerator
-from prompts import get_image_prompt_dict
-from llm_integration import call_llm_gorq
+from scene_parser import get_scene_dict
+from artifacts import send_artifact, counts_as_download
+from storage import init_storage, cache_privately, migrate_to_sharded, iter_flat_generation_dirs
+from content_cache import get_generation_content
+from counters import count_download, init_counter_buffer
+from rate_limit import init_rate_limiter
+import history_index
+from retention import run_retention
 
 # Import SaaS components
 from models import db, User, Generation, ApiKey, SubscriptionPlan, PaymentHistory
+from migrations import run_migrations
 from auth import auth_bp, init_login_manager
 from subscription import sub_bp, init_stripe, initialize_plans
 from dashboard import dashboard_bp
 from api import api_bp
+from jobs import init_job_queue
 from email_service import send_welcome_email, send_generation_completion_notification
 
 # Load environment variables
@@ -35,8 +45,31 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-in-production')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///shorts_generator.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['OUTPUT_FOLDER'] = 'static/outputs'
+    app.config['OUTPUT_FOLDER'] = os.getenv('OUTPUT_FOLDER', 'static/outputs')  # Local working copy of generations
+    
+    # Artifact storage: 'local' (OUTPUT_FOLDER) or 's3' (any S3-compatible service)
+    app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'local')
+    app.config['S3_BUCKET'] = os.getenv('S3_BUCKET')
+    app.config['S3_PREFIX'] = os.getenv('S3_PREFIX', 'generations')
+    app.config['S3_ENDPOINT_URL'] = os.getenv('S3_ENDPOINT_URL')  # e.g. a local MinIO
+    app.config['S3_REGION'] = os.getenv('S3_REGION')
+    app.config['S3_PRESIGN_EXPIRES'] = int(os.getenv('S3_PRESIGN_EXPIRES', 300))
+    app.config['S3_MULTIPART_THRESHOLD'] = int(os.getenv('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+    app.config['S3_MULTIPART_CHUNKSIZE'] = int(os.getenv('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+    
+    # Generations older than RETENTION_DAYS are compressed into the cold tier (0 disables)
+    app.config['RETENTION_DAYS'] = float(os.getenv('RETENTION_DAYS', 30))
+    app.config['RETENTION_CODEC'] = os.getenv('RETENTION_CODEC', 'zstd')  # 'zstd' or 'gzip'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))  # Background generation workers
+    app.config['BATCH_WORKERS'] = int(os.getenv('BATCH_WORKERS', 3))  # Parallel items per process for batch requests
+    app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', 50))
+    app.config['HISTORY_PER_PAGE'] = int(os.getenv('HISTORY_PER_PAGE', 12))
+    app.config['ZIP_BUNDLE_MODE'] = os.getenv('ZIP_BUNDLE_MODE', 'stream')  # 'stream' or 'precompute'
+    app.config['OUTPUT_CACHE_MAX_AGE'] = int(os.getenv('OUTPUT_CACHE_MAX_AGE', 365 * 24 * 3600))  # Generated outputs never change
+    app.config['COUNTER_FLUSH_SECONDS'] = int(os.getenv('COUNTER_FLUSH_SECONDS', 10))  # View/download counters are written in bulk
+    app.config['RATE_LIMIT_FLUSH_SECONDS'] = int(os.getenv('RATE_LIMIT_FLUSH_SECONDS', 5))  # API key usage is written in bulk
+    app.config['API_COMPRESS_MIN_SIZE'] = int(os.getenv('API_COMPRESS_MIN_SIZE', 1024))  # Smaller API responses are sent uncompressed
     
     # Email configuration
     app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -55,6 +88,7 @@ def create_app():
     db.init_app(app)
     init_login_manager(app)
     init_stripe(app)
+    init_storage(app)
     
     # Ensure output directory exists
     try:
@@ -72,26 +106,23 @@ def create_app():
     # Background tasks scheduler
     scheduler = BackgroundScheduler()
     
-    @scheduler.scheduled_job('cron', day=1, hour=0, minute=0)
-    def reset_monthly_counters():
-        """Reset monthly generation counters on the first day of each month"""
-        with app.app_context():
-            users = User.query.all()
-            for user in users:
-                user.monthly_generations = 0
-            db.session.commit()
-            logger.info("Monthly generation counters reset")
+    # Monthly generation and daily API request counters need no reset job: they are
+    # stamped with their period and read as zero once it is over (see models.py)
     
-    @scheduler.scheduled_job('cron', day='*', hour=0, minute=0)
-    def reset_daily_api_usage():
-        """Reset daily API request counters"""
-        with app.app_context():
-            api_keys = ApiKey.query.all()
-            for key in api_keys:
-                key.daily_requests = 0
-            db.session.commit()
-            logger.info("Daily API request counters reset")
+    @scheduler.scheduled_job('cron', day='*', hour=3, minute=0)
+    def compress_old_generations():
+        """Move generations older than RETENTION_DAYS to the compressed cold tier"""
+        if not app.config['RETENTION_DAYS'] or app.config['STORAGE_BACKEND'] != 'local':
+            # Object stores handle this with bucket lifecycle rules
+            return
+        run_retention(app.config['OUTPUT_FOLDER'], app.config['RETENTION_DAYS'], app.config['RETENTION_CODEC'])
             
+    # Flush buffered view/download counters periodically and at shutdown
+    init_counter_buffer(app, scheduler)
+    
+    # Persist API key usage counted by the rate limiter
+    init_rate_limiter(app, scheduler)
+    
     # Start scheduler
     scheduler.start()
     
@@ -102,6 +133,30 @@ def create_app():
             return redirect(url_for('dashboard.index'))
         return render_template('index.html')
     
+    def record_generation(generator, country, file_paths):
+        """Store the generation for the logged-in user and notify them"""
+        if not current_user.is_authenticated:
+            return
+        new_generation = Generation(
+            generation_id=generator.generation_id,
+            user_id=current_user.id,
+            country=country,
+            story_path=file_paths['story_path'],
+            voiceover_path=file_paths['voiceover_path'],
+            voiceover_tts_path=file_paths['voiceover_tts_path'],
+            scenes_path=file_paths['scenes_path']
+        )
+        db.session.add(new_generation)
+        db.session.commit()
+        
+        # Send notification email (async in production)
+        send_generation_completion_notification(
+            current_user.email,
+            current_user.username,
+            country,
+            generator.generation_id
+        )
+    
     @app.route('/generate', methods=['POST'])
     def generate():
         """Legacy endpoint for backward compatibility"""
@@ -121,51 +176,28 @@ def create_app():
             if not country:
                 return jsonify({"error": "Country name is required."}), 400
                 
-            generator = YouTubeShortsGenerator()
+            generator = YouTubeShortsGenerator(app.config['OUTPUT_FOLDER'])
             generator.set_country(country)
             
             # Generate all outputs
             results = generator.generate_all()
             
-            # Generate scene image prompts
+            # Convert scene prompts to the scene dictionary (parsed locally, LLM only as a fallback)
             try:
-                scene_prompts = call_llm_gorq(get_image_prompt_dict(results["scenes"]))
-                if "Error" in scene_prompts:
-                    logger.warning("LLM returned an error for scene generation")
-                    scene_prompts = "Scene generation failed."
-                results["scenes"] = scene_prompts
-            except Exception as e:
-                logger.exception("Error generating scenes via LLM:")
-                results["scenes"] = "Scene generation error."
+                results["scenes"] = json.dumps(get_scene_dict(results["scenes"]), indent=2, ensure_ascii=False)
+            except ValueError:
+                logger.exception("Error converting scene prompts:")
+                results["scenes"] = "Scene generation failed."
                 
             # Save outputs
             try:
-                file_paths = generator.save_outputs(app.config['OUTPUT_FOLDER'])
+                file_paths = generator.save_outputs(app.config['OUTPUT_FOLDER'], bundle=app.config['ZIP_BUNDLE_MODE'] == 'precompute')
             except Exception as e:
                 logger.exception("Error saving generated outputs:")
                 return jsonify({"error": "Failed to save outputs."}), 500
                 
             # If user is authenticated, record the generation
-            if current_user.is_authenticated:
-                new_generation = Generation(
-                    generation_id=generator.generation_id,
-                    user_id=current_user.id,
-                    country=country,
-                    story_path=file_paths['story_path'],
-                    voiceover_path=file_paths['voiceover_path'],
-                    voiceover_tts_path=file_paths['voiceover_tts_path'],
-                    scenes_path=file_paths['scenes_path']
-                )
-                db.session.add(new_generation)
-                db.session.commit()
-                
-                # Send notification email (async in production)
-                send_generation_completion_notification(
-                    current_user.email,
-                    current_user.username,
-                    country,
-                    generator.generation_id
-                )
+            record_generation(generator, country, file_paths)
                 
             response_data = {
                 "status": "success",
@@ -198,27 +230,77 @@ def create_app():
             logger.exception("Error in /generate endpoint:")
             return jsonify({"error": str(e)}), 500
     
+    @app.route('/generate/stream')
+    def generate_stream():
+        """Stream story and voiceover text to the browser as Server-Sent Events"""
+        country = request.args.get('country', '').strip()
+        if not country:
+            return jsonify({"error": "Country name is required."}), 400
+        
+        if current_user.is_authenticated:
+            if not current_user.can_generate():
+                return jsonify({"error": "Monthly generation limit reached."}), 403
+            current_user.increment_generation_count()
+        
+        def sse(event, data):
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        
+        def events():
+            generator = YouTubeShortsGenerator(app.config['OUTPUT_FOLDER'])
+            generator.set_country(country)
+            try:
+                for token in generator.stream_story():
+                    yield sse('story', {'token': token})
+                
+                # Scene prompts only need the story, so build them while the voiceover streams
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    scenes_future = executor.submit(generator.generate_scene_prompts)
+                    for token in generator.stream_voiceover_script():
+                        yield sse('voiceover', {'token': token})
+                    yield sse('stage', {'stage': 'tts', 'status': 'running'})
+                    generator.synthesize_voiceover()
+                    yield sse('scenes', {'text': scenes_future.result()})
+                
+                file_paths = generator.save_outputs(app.config['OUTPUT_FOLDER'], bundle=app.config['ZIP_BUNDLE_MODE'] == 'precompute')
+                record_generation(generator, country, file_paths)
+                yield sse('done', {
+                    'generation_id': generator.generation_id,
+                    'paths': file_paths
+                })
+            except Exception as e:
+                logger.exception("Error in /generate/stream endpoint:")
+                yield sse('error', {'error': str(e)})
+        
+        return Response(
+            stream_with_context(events()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
     @app.route('/outputs/<path:filename>')
     def download_file(filename):
         """Legacy endpoint for backward compatibility"""
         try:
-            # If user is authenticated, track the download
-            if current_user.is_authenticated:
-                # Extract generation_id from the path
-                # Assuming path format is: outputs/{generation_id}/file.ext
-                parts = filename.split('/')
-                if len(parts) >= 2:
-                    generation_id = parts[0]
-                    generation = Generation.query.filter_by(
-                        generation_id=generation_id,
-                        user_id=current_user.id
-                    ).first()
-                    
-                    if generation:
-                        generation.download_count += 1
-                        db.session.commit()
+            # Text artifacts of newer generations live inside the generation's pack
+            parts = filename.split('/')
+            response = None
+            if len(parts) == 2:
+                response = send_artifact(parts[0], parts[1])
+            if response is None:
+                response = cache_privately(send_from_directory(app.config['OUTPUT_FOLDER'], filename, as_attachment=True,
+                                                               conditional=True, max_age=app.config['OUTPUT_CACHE_MAX_AGE']))
+            
+            # If user is authenticated, track the download (not revalidations or resumed transfers)
+            # Assuming path format is: outputs/{generation_id}/file.ext
+            if current_user.is_authenticated and len(parts) >= 2 and counts_as_download(response):
+                generation = Generation.query.filter_by(
+                    generation_id=parts[0],
+                    user_id=current_user.id
+                ).first()
                 
-            return send_from_directory(app.config['OUTPUT_FOLDER'], filename, as_attachment=True)
+                if generation:
+                    count_download(generation)
+            return response
         except Exception as e:
             logger.exception("Error in file download:")
             return jsonify({"error": "File not found."}), 404
@@ -230,18 +312,25 @@ def create_app():
         if current_user.is_authenticated:
             return redirect(url_for('dashboard.generations'))
             
-        # For non-authenticated users, fallback to the original behavior
+        # For non-authenticated users, serve the maintained history index
         try:
-            history_data = []
-            for root, dirs, files in os.walk(app.config['OUTPUT_FOLDER']):
-                for dir_name in dirs:
-                    metadata_path = os.path.join(app.config['OUTPUT_FOLDER'], dir_name, "metadata.json")
-                    if os.path.exists(metadata_path):
-                        with open(metadata_path, 'r', encoding="utf-8") as f:
-                            metadata = json.load(f)
-                            history_data.append(metadata)
-            history_data.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-            return render_template('history.html', history=history_data)
+            before, after = (request.args.get(name) for name in ('before', 'after'))
+            before = history_index.decode_cursor(before) if before else None
+            after = history_index.decode_cursor(after) if after else None
+        except ValueError:
+            return render_template('history.html', history=[], error='Invalid page cursor.'), 400
+        try:
+            history_data, total, has_newer, has_older = history_index.get_history_page(
+                app.config['OUTPUT_FOLDER'],
+                per_page=app.config['HISTORY_PER_PAGE'],
+                before=before,
+                after=after
+            )
+            return render_template('history.html',
+                                history=history_data,
+                                total=total,
+                                newer_cursor=history_index.encode_cursor(history_data[0]) if has_newer and history_data else None,
+                                older_cursor=history_index.encode_cursor(history_data[-1]) if has_older and history_data else None)
         except Exception as e:
             logger.exception("Error loading history:")
             return render_template('history.html', history=[], error=str(e))
@@ -262,26 +351,16 @@ def create_app():
                 
         # For non-authenticated users or other generations, fallback to original behavior
         try:
-            gen_dir = os.path.join(app.config['OUTPUT_FOLDER'], generation_id)
-            metadata_path = os.path.join(gen_dir, "metadata.json")
-            if not os.path.exists(metadata_path):
+            try:
+                content = get_generation_content(generation_id)
+            except FileNotFoundError:
                 return render_template('error.html', message="Generation not found")
                 
-            with open(metadata_path, 'r', encoding="utf-8") as f:
-                metadata = json.load(f)
-                
-            with open(os.path.join(gen_dir, "story.txt"), 'r', encoding="utf-8") as f:
-                story = f.read()
-            with open(os.path.join(gen_dir, "voiceover.txt"), 'r', encoding="utf-8") as f:
-                voiceover = f.read()
-            with open(os.path.join(gen_dir, "scenes.txt"), 'r', encoding="utf-8") as f:
-                scenes = f.read()
-                
             return render_template('view.html', 
-                                metadata=metadata, 
-                                story=story, 
-                                voiceover=voiceover, 
-                                scenes=scenes,
+                                metadata=content['metadata'], 
+                                story=content['story'], 
+                                voiceover=content['voiceover'], 
+                                scenes=content['scenes'],
                                 generation_id=generation_id)
                                 
         except Exception as e:
@@ -309,12 +388,32 @@ def create_app():
             if plan:
                 data['plan_limit'] = plan.monthly_generations
                 if plan.monthly_generations > 0:
-                    data['usage_percent'] = min(100, (current_user.monthly_generations / plan.monthly_generations) * 100)
+                    data['usage_percent'] = min(100, (current_user.generations_this_month() / plan.monthly_generations) * 100)
                 else:
                     data['usage_percent'] = 100
                     
         return data
         
+    @app.cli.command('rebuild-history-index')
+    def rebuild_history_index():
+        """Rebuild the /history index from the generations in OUTPUT_FOLDER."""
+        count = history_index.rebuild_index(app.config['OUTPUT_FOLDER'])
+        print(f"Indexed {count} generations")
+    
+    @app.cli.command('migrate-output-layout')
+    @click.option('--limit', type=int, default=None, help='Move at most this many generations.')
+    def migrate_output_layout(limit):
+        """Move flat generation directories to the sharded layout; safe to interrupt and rerun."""
+        moved = migrate_to_sharded(app.config['OUTPUT_FOLDER'], limit=limit)
+        remaining = sum(1 for _ in iter_flat_generation_dirs(app.config['OUTPUT_FOLDER']))
+        print(f"Moved {moved} generations, {remaining} left in the flat layout")
+    
+    @app.cli.command('run-retention')
+    def run_retention_command():
+        """Compress generations older than RETENTION_DAYS into the cold tier now."""
+        report = run_retention(app.config['OUTPUT_FOLDER'], app.config['RETENTION_DAYS'], app.config['RETENTION_CODEC'])
+        print(f"Compressed {report['generations']} generations, reclaimed {report['bytes_reclaimed']} bytes")
+    
     @app.errorhandler(404)
     def page_not_found(e):
         return render_template('error.html', message="Page not found"), 404
@@ -326,8 +425,12 @@ def create_app():
     # Initialize database and subscription plans on first run
     with app.app_context():
         db.create_all()
+        run_migrations()
         initialize_plans()
     
+    # Start background generation workers (needs the job table to exist)
+    init_job_queue(app)
+    
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,275 @@
+import io
+import os
+import json
+import time
+import hashlib
+import shutil
+import struct
+import zipfile
+import tempfile
+import mimetypes
+from typing import Dict, Iterator, List, Optional
+
+from flask import current_app, request, send_file
+
+from compression import ENCODING_SUFFIXES, choose_encoding, encode_variants
+from durability import fsync_file
+from storage import LocalStorage, cache_privately, get_storage, write_etag
+
+# A generation's text artifacts and metadata live in one packed file:
+#   magic (8 bytes) | index length (4 bytes, big-endian) | JSON index | data
+# The index maps each artifact name to [offset, length] relative to the start of the data.
+PACK_NAME = "generation.pack"
+PACK_MAGIC = b"YSGPACK1"
+TEXT_ARTIFACTS = ("story.txt", "voiceover.txt", "scenes.txt", "metadata.json")
+AUDIO_ARTIFACT = "voiceover_tts.mp3"
+# Precomputed "download all" archive (ZIP_BUNDLE_MODE=precompute)
+BUNDLE_NAME = "bundle.zip"
+BUNDLE_ARTIFACTS = ("story.txt", "voiceover.txt", AUDIO_ARTIFACT, "scenes.txt")
+# Artifacts are written here first and renamed into the generation directory
+STAGING_DIR = ".staging"
+
+
+def add_encoded_variants(entries: Dict[str, bytes]) -> Dict[str, bytes]:
+    """
+    Add precompressed variants of the text artifacts (story.txt.gz, story.txt.br, ...).
+
+    They are stored in the pack next to the plain text, so downloads can be sent
+    with a Content-Encoding the client accepts without compressing per request.
+    """
+    variants = {}
+    for name, data in entries.items():
+        if name in TEXT_ARTIFACTS:
+            for encoding, encoded in encode_variants(data).items():
+                variants[name + ENCODING_SUFFIXES[encoding]] = encoded
+    return {**entries, **variants}
+
+
+def write_pack(path: str, entries: Dict[str, bytes]) -> None:
+    """Write artifacts into a single packed file."""
+    index = {}
+    offset = 0
+    for name, data in entries.items():
+        index[name] = [offset, len(data)]
+        offset += len(data)
+    index_bytes = json.dumps(index).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(PACK_MAGIC + struct.pack(">I", len(index_bytes)) + index_bytes)
+        for data in entries.values():
+            f.write(data)
+
+
+def parse_pack(raw: bytes) -> Dict[str, bytes]:
+    """Split the contents of a packed file into its artifacts."""
+    if raw[:len(PACK_MAGIC)] != PACK_MAGIC:
+        raise ValueError("Not a generation pack")
+
+    header_size = len(PACK_MAGIC) + 4
+    (index_length,) = struct.unpack(">I", raw[len(PACK_MAGIC):header_size])
+    index = json.loads(raw[header_size:header_size + index_length])
+    data_start = header_size + index_length
+    return {
+        name: raw[data_start + offset:data_start + offset + length]
+        for name, (offset, length) in index.items()
+    }
+
+
+def create_staging_dir(output_dir: str, generation_id: str) -> str:
+    """Create a private staging directory on the same filesystem as the outputs."""
+    root = os.path.join(output_dir, STAGING_DIR)
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{generation_id}-", dir=root)
+
+
+def publish_staged(staging_dir: str, gen_dir: str) -> List[str]:
+    """
+    Move every staged file into the generation directory with an atomic rename.
+
+    Readers see either the previous file or the complete new one, never a partial write.
+    Each file is fsynced before its rename, so after a crash the published name
+    never points at missing data; the directory fsync is left to sync_later.
+
+    Returns:
+        list: Paths of the published files.
+    """
+    os.makedirs(gen_dir, exist_ok=True)
+    published = []
+    for name in os.listdir(staging_dir):
+        path = os.path.join(gen_dir, name)
+        staged = os.path.join(staging_dir, name)
+        fsync_file(staged)
+        os.replace(staged, path)
+        published.append(path)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return published
+
+
+def read_artifact(generation_id: str, name: str, storage=None) -> Optional[bytes]:
+    """
+    Read one text artifact, from the pack or (for older generations) the loose file.
+
+    Args:
+        storage: Backend to read from, defaults to the application's storage.
+
+    Returns None if the artifact does not exist.
+    """
+    storage = storage or get_storage()
+    pack = storage.read(generation_id, PACK_NAME)
+    if pack is not None:
+        return parse_pack(pack).get(name)
+    return storage.read(generation_id, name)
+
+
+def load_generation_content(generation_id: str, storage=None) -> dict:
+    """
+    Load story, voiceover, scenes and metadata of a generation.
+
+    Raises:
+        FileNotFoundError: If the generation has neither a pack nor loose files.
+    """
+    storage = storage or get_storage()
+    pack = storage.read(generation_id, PACK_NAME)
+    if pack is not None:
+        entries = parse_pack(pack)
+    else:
+        # Generations saved before packing was introduced
+        entries = {}
+        for name in TEXT_ARTIFACTS:
+            data = storage.read(generation_id, name)
+            if data is None:
+                raise FileNotFoundError(f"{generation_id}/{name}")
+            entries[name] = data
+
+    return {
+        'story': entries.get("story.txt", b"").decode("utf-8"),
+        'voiceover': entries.get("voiceover.txt", b"").decode("utf-8"),
+        'scenes': entries.get("scenes.txt", b"").decode("utf-8"),
+        'metadata': json.loads(entries.get("metadata.json", b"{}"))
+    }
+
+
+def counts_as_download(response) -> bool:
+    """
+    Whether a response delivered a new download.
+
+    Revalidations (304) and Range requests continuing a transfer are not counted.
+    Redirects to object storage count, as the client fetches the object itself.
+    """
+    if response.status_code in (200, 302):
+        return True
+    return response.status_code == 206 and (response.headers.get("Content-Range") or "").startswith("bytes 0-")
+
+
+def send_artifact(generation_id: str, name: str, download_name: Optional[str] = None):
+    """
+    Send a generation artifact as a download.
+
+    Text artifacts are sent from the pack; other files are handed to the storage
+    backend, which sends them itself or redirects to the object store. Responses
+    carry a strong ETag and long-lived cache headers; If-None-Match and Range
+    requests are answered with 304 and 206 responses.
+
+    Returns None if the artifact does not exist.
+    """
+    download_name = download_name or name
+    if name in TEXT_ARTIFACTS:
+        storage = get_storage()
+        pack = storage.read(generation_id, PACK_NAME)
+        entries = parse_pack(pack) if pack is not None else {name: storage.read(generation_id, name)}
+        data = entries.get(name)
+        if data is None:
+            return None
+        
+        # Precompressed variant matching Accept-Encoding, if the pack has one
+        encoding = choose_encoding(request.accept_encodings,
+                                   [encoding for encoding, suffix in ENCODING_SUFFIXES.items() if name + suffix in entries])
+        if encoding:
+            data = entries[name + ENCODING_SUFFIXES[encoding]]
+        mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        response = send_file(io.BytesIO(data), mimetype=mimetype, download_name=download_name, as_attachment=True,
+                             etag=hashlib.sha256(data).hexdigest()[:32], conditional=True,
+                             max_age=current_app.config['OUTPUT_CACHE_MAX_AGE'])
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        return cache_privately(response)
+
+    return get_storage().send(generation_id, name, download_name)
+
+
+def _write_bundle_members(zf: zipfile.ZipFile, generation_id: str, storage) -> Iterator[None]:
+    """Add the bundle artifacts to an open archive, yielding after each chunk written."""
+    for name in BUNDLE_ARTIFACTS:
+        if name in TEXT_ARTIFACTS:
+            data = read_artifact(generation_id, name, storage)
+            if data is not None:
+                zf.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED)
+                yield
+            continue
+
+        chunks = storage.iter_chunks(generation_id, name)
+        if chunks is None:
+            continue
+        # MP3 is already compressed; store it as is
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        with zf.open(info, "w") as dst:
+            for chunk in chunks:
+                dst.write(chunk)
+                yield
+
+
+def write_bundle(output_dir: str, generation_id: str) -> str:
+    """
+    Write the "download all" archive of a generation next to its local artifacts.
+
+    Returns:
+        str: Path of the archive.
+    """
+    local = LocalStorage(output_dir)
+    path = local.path(generation_id, BUNDLE_NAME)
+    tmp_path = path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w") as zf:
+        for _ in _write_bundle_members(zf, generation_id, local):
+            pass
+    fsync_file(tmp_path)
+    os.replace(tmp_path, path)
+    write_etag(path)
+    return path
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable sink holding what zipfile wrote until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # zipfile needs offsets for the central directory, not a seekable stream
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_bundle(generation_id: str) -> Iterator[bytes]:
+    """Yield the "download all" archive as it is compressed, holding one chunk at a time."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for _ in _write_bundle_members(zf, generation_id, get_storage()):
+            data = sink.drain()
+            if data:
+                yield data
+    # Closing the archive writes the central directory
+    yield sink.drain()
@@ -1,14 +1,17 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, make_response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
 from itsdangerous import URLSafeTimedSerializer
 from models import db, User, ApiKey
+import queries
 import uuid
 import secrets
 import string
 from functools import wraps
 import re
 from email_service import send_reset_password_email
+from rate_limit import get_rate_limiter, rate_limit_headers
+from api_key_cache import ApiUser, invalidate_api_key, resolve_api_key
 
 # Initialize Blueprint
 auth_bp = Blueprint('auth', __name__)
@@ -32,6 +35,12 @@ def init_login_manager(app):
         return redirect(url_for('auth.login'))
 
 
+def _stored_requests_today(key_id):
+    """Requests stored for an API key today; 0 if the key row was deleted while still cached."""
+    key = db.session.get(ApiKey, key_id)
+    return key.requests_today() if key else 0
+
+
 def api_key_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -39,32 +48,25 @@ def api_key_required(f):
         if not api_key:
             return jsonify({'error': 'API key is required'}), 401
             
-        key = ApiKey.query.filter_by(api_key=api_key, is_active=True).first()
-        if not key:
+        # Cached key -> (user, tier, status); the User row is only loaded if the handler needs it
+        resolved = resolve_api_key(api_key)
+        if not resolved:
             return jsonify({'error': 'Invalid API key'}), 401
             
         # Check if user's subscription is active
-        user = User.query.get(key.user_id)
-        if not user or user.subscription_status != 'active':
+        if resolved.subscription_status != 'active':
             return jsonify({'error': 'Subscription inactive or expired'}), 403
             
-        # Check rate limits based on subscription tier
-        rate_limits = {
-            'free': 10,
-            'basic': 100,
-            'premium': 1000
-        }
-        
-        if key.daily_requests >= rate_limits.get(user.subscription_tier, 0):
-            return jsonify({'error': 'Daily API rate limit exceeded'}), 429
-            
-        # Increment usage counter
-        key.increment_usage()
-        db.session.commit()
+        # Burst and daily limits are enforced in memory; usage is persisted in batches
+        result = get_rate_limiter().check(resolved.key_id, resolved.subscription_tier,
+                                          lambda: _stored_requests_today(resolved.key_id))
+        if not result.allowed:
+            message = 'Daily API rate limit exceeded' if result.reason == 'daily' else 'Too many requests, slow down'
+            return rate_limit_headers(make_response(jsonify({'error': message}), 429), result)
         
         # Set current user for the request
-        kwargs['user'] = user
-        return f(*args, **kwargs)
+        kwargs['user'] = ApiUser(resolved)
+        return rate_limit_headers(make_response(f(*args, **kwargs)), result)
     return decorated_function
 
 
@@ -248,7 +250,7 @@ def reset_password(token):
 @login_required
 def api_keys_list():
     """View all API keys for the current user"""
-    api_keys = ApiKey.query.filter_by(user_id=current_user.id).all()
+    api_keys = queries.user_api_keys(current_user.id).all()
     return render_template('auth/api_keys.html', api_keys=api_keys)
 
 
@@ -287,6 +289,7 @@ def deactivate_api_key(key_id):
         
     key.is_active = False
     db.session.commit()
+    invalidate_api_key(key.api_key)
     
     flash('API key deactivated successfully.', 'success')
     return redirect(url_for('auth.api_keys_list'))
\ No newline at end of file
@@ -0,0 +1,64 @@
+import gzip
+import logging
+from typing import Dict, Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip variants are produced without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Content-Encoding -> suffix of the precompressed variant, in order of preference
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def encode_variants(data: bytes) -> Dict[str, bytes]:
+    """Return the precompressed variants of data, keyed by Content-Encoding."""
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)
+    return variants
+
+
+def choose_encoding(accept_encodings, available: Iterable[str]) -> Optional[str]:
+    """
+    Pick the best encoding the client accepts among the available ones.
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding header.
+        available: Encodings a variant exists for.
+    """
+    available = set(available)
+    for encoding in ENCODING_SUFFIXES:
+        if encoding in available and accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress_response(response, accept_encodings, min_size: int):
+    """
+    Compress a buffered response body in place if the client accepts it.
+
+    Small, streamed, already encoded and non-success responses are left untouched.
+    """
+    if (response.direct_passthrough or response.is_streamed or not 200 <= response.status_code < 300
+            or "Content-Encoding" in response.headers):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+    encoding = choose_encoding(accept_encodings, ("br", "gzip") if brotli is not None else ("gzip",))
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        # Low quality: this runs on every response, unlike the precompressed artifacts
+        body = brotli.compress(body, quality=4)
+    else:
+        body = gzip.compress(body, compresslevel=6)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,115 @@
+import os
+import copy
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from artifacts import load_generation_content
+
+logger = logging.getLogger(__name__)
+
+
+def _content_size(content: dict) -> int:
+    """Approximate memory footprint of loaded generation content in bytes."""
+    size = sum(len(content[field].encode("utf-8")) for field in ("story", "voiceover", "scenes"))
+    return size + len(json.dumps(content["metadata"]))
+
+
+class ContentCache:
+    """
+    Process-wide LRU cache of parsed generation content, bounded by a byte budget.
+
+    Generations do not change after they are saved, so entries stay valid until
+    invalidate() is called for a directory that is rewritten or deleted.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, generation_id: str) -> dict:
+        """
+        Return the content of a generation, loading it from storage on a miss.
+
+        Raises:
+            FileNotFoundError: If the generation does not exist.
+        """
+        with self._lock:
+            entry = self._entries.get(generation_id)
+            if entry is not None:
+                self._entries.move_to_end(generation_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            content = load_generation_content(generation_id)
+            self._put(generation_id, content, _content_size(content))
+        else:
+            content = entry[0]
+
+        # Metadata is the only mutable part; keep the cached copy untouched
+        return {**content, "metadata": copy.deepcopy(content["metadata"])}
+
+    def _put(self, key: str, content: dict, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (content, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, generation_id: str) -> None:
+        """Drop a generation from the cache after it was rewritten or deleted."""
+        with self._lock:
+            entry = self._entries.pop(generation_id, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_content_cache() -> ContentCache:
+    """Return the process-wide generation content cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ContentCache(int(os.getenv("CONTENT_CACHE_MAX_BYTES", 64 * 1024 * 1024)))
+    return _cache
+
+
+def get_generation_content(generation_id: str) -> dict:
+    """Cached equivalent of artifacts.load_generation_content."""
+    return get_content_cache().get(generation_id)
+
+
+def invalidate_generation(generation_id: str) -> None:
+    get_content_cache().invalidate(generation_id)
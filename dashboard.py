@@ -1,6 +1,10 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, abort, Response, stream_with_context
 from flask_login import login_required, current_user
 from models import db, User, Generation, PaymentHistory, SubscriptionPlan
+import queries
+from artifacts import send_artifact, stream_bundle, counts_as_download, BUNDLE_NAME
+from content_cache import get_generation_content
+from counters import count_view, count_download, current_count
 from datetime import datetime, timedelta
 import json
 import os
@@ -12,10 +16,7 @@ dashboard_bp = Blueprint('dashboard', __name__)
 def index():
     """Main dashboard page showing user stats and recent generations"""
     # Get recent generations
-    recent_generations = Generation.query.filter_by(user_id=current_user.id)\
-        .order_by(Generation.timestamp.desc())\
-        .limit(5)\
-        .all()
+    recent_generations = queries.recent_generations(current_user.id).all()
     
     # Calculate usage statistics
     usage_percent = 0
@@ -23,7 +24,7 @@ def index():
         plan = SubscriptionPlan.query.filter_by(name=current_user.subscription_tier).first()
         if plan:
             limit = plan.monthly_generations
-            usage_percent = (current_user.monthly_generations / limit) * 100 if limit > 0 else 0
+            usage_percent = (current_user.generations_this_month() / limit) * 100 if limit > 0 else 0
     
     # Get subscription details
     current_plan = SubscriptionPlan.query.filter_by(name=current_user.subscription_tier).first()
@@ -33,10 +34,7 @@ def index():
     
     # Get total generations this month
     month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_generations_count = Generation.query.filter(
-        Generation.user_id == current_user.id,
-        Generation.timestamp >= month_start
-    ).count()
+    month_generations_count = queries.generations_since(current_user.id, month_start).count()
     
     return render_template('dashboard/index.html',
                           recent_generations=recent_generations,
@@ -59,29 +57,9 @@ def generations():
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
     
-    # Build query
-    query = Generation.query.filter_by(user_id=current_user.id)
-    
-    if country:
-        query = query.filter(Generation.country.ilike(f'%{country}%'))
-    
-    if date_from:
-        try:
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(Generation.timestamp >= date_from_obj)
-        except ValueError:
-            pass
-    
-    if date_to:
-        try:
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d')
-            date_to_obj = date_to_obj.replace(hour=23, minute=59, second=59)
-            query = query.filter(Generation.timestamp <= date_to_obj)
-        except ValueError:
-            pass
-    
     # Paginate results
-    generations = query.order_by(Generation.timestamp.desc()).paginate(page=page, per_page=per_page)
+    generations = queries.generation_listing(current_user.id, country, date_from, date_to)\
+        .paginate(page=page, per_page=per_page)
     
     return render_template('dashboard/generations.html',
                           generations=generations,
@@ -94,31 +72,14 @@ def generations():
 @login_required
 def view_generation(generation_id):
     """View details of a specific generation"""
-    generation = Generation.query.filter_by(
-        generation_id=generation_id,
-        user_id=current_user.id
-    ).first_or_404()
-    
-    # Increment view count
-    generation.view_count += 1
-    db.session.commit()
+    generation = queries.user_generation(current_user.id, generation_id).first_or_404()
     
-    # Load content files
-    content = {}
-    base_dir = os.path.join('static', 'outputs', generation.generation_id)
+    # Increment view count (buffered, written in bulk by the counter flush)
+    count_view(generation)
     
+    # Load content (packed file, or loose files for older generations)
     try:
-        with open(os.path.join(base_dir, 'story.txt'), 'r', encoding='utf-8') as f:
-            content['story'] = f.read()
-        
-        with open(os.path.join(base_dir, 'voiceover.txt'), 'r', encoding='utf-8') as f:
-            content['voiceover'] = f.read()
-        
-        with open(os.path.join(base_dir, 'scenes.txt'), 'r', encoding='utf-8') as f:
-            content['scenes'] = f.read()
-        
-        with open(os.path.join(base_dir, 'metadata.json'), 'r', encoding='utf-8') as f:
-            content['metadata'] = json.load(f)
+        content = get_generation_content(generation.generation_id)
     except Exception as e:
         flash(f'Error loading content: {str(e)}', 'error')
         content = {
@@ -130,24 +91,23 @@ def view_generation(generation_id):
     
     return render_template('dashboard/view_generation.html',
                           generation=generation,
-                          content=content)
+                          content=content,
+                          view_count=current_count(generation, 'view_count'),
+                          download_count=current_count(generation, 'download_count'))
 
 
 @dashboard_bp.route('/download/<generation_id>/<file_type>')
 @login_required
 def download_file(generation_id, file_type):
     """Download files associated with a generation"""
-    generation = Generation.query.filter_by(
-        generation_id=generation_id,
-        user_id=current_user.id
-    ).first_or_404()
+    generation = queries.user_generation(current_user.id, generation_id).first_or_404()
     
-    # Map file types to file paths
+    # Map file types to artifact names
     file_paths = {
-        'story': os.path.join('static', 'outputs', generation_id, 'story.txt'),
-        'voiceover': os.path.join('static', 'outputs', generation_id, 'voiceover.txt'),
-        'audio': os.path.join('static', 'outputs', generation_id, 'voiceover_tts.mp3'),
-        'scenes': os.path.join('static', 'outputs', generation_id, 'scenes.txt'),
+        'story': 'story.txt',
+        'voiceover': 'voiceover.txt',
+        'audio': 'voiceover_tts.mp3',
+        'scenes': 'scenes.txt',
         'all': None  # Handled separately for zip downloads
     }
     
@@ -155,29 +115,23 @@ def download_file(generation_id, file_type):
         flash('Invalid file type requested.', 'error')
         return redirect(url_for('dashboard.view_generation', generation_id=generation_id))
     
-    # Increment download count
-    generation.download_count += 1
-    db.session.commit()
-    
     if file_type == 'all':
-        # Create zip file with all content
-        import zipfile
-        from io import BytesIO
-        
-        memory_file = BytesIO()
-        with zipfile.ZipFile(memory_file, 'w') as zf:
-            for name, path in file_paths.items():
-                if name != 'all' and os.path.exists(path):
-                    zf.write(path, os.path.basename(path))
-        
-        memory_file.seek(0)
-        return send_file(memory_file,
-                        download_name=f"{generation_id}_complete.zip",
-                        as_attachment=True)
+        # Precomputed at save time (ZIP_BUNDLE_MODE=precompute)
+        download_name = f"{generation_id}_complete.zip"
+        response = send_artifact(generation_id, BUNDLE_NAME, download_name)
+        if response is None:
+            # Compress while sending, so memory use does not grow with the archive
+            response = Response(stream_with_context(stream_bundle(generation_id)), mimetype='application/zip')
+            response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
     else:
-        return send_file(file_paths[file_type],
-                        download_name=os.path.basename(file_paths[file_type]),
-                        as_attachment=True)
+        response = send_artifact(generation_id, file_paths[file_type])
+        if response is None:
+            abort(404)
+    
+    # Count downloads, not cache revalidations or resumed transfers
+    if counts_as_download(response):
+        count_download(generation)
+    return response
 
 
 @dashboard_bp.route('/subscription')
@@ -188,10 +142,7 @@ def subscription():
     current_plan = SubscriptionPlan.query.filter_by(name=current_user.subscription_tier).first()
     
     # Get payment history
-    payments = PaymentHistory.query.filter_by(user_id=current_user.id)\
-        .order_by(PaymentHistory.payment_date.desc())\
-        .limit(10)\
-        .all()
+    payments = queries.payment_history(current_user.id).all()
     
     # Calculate subscription status and next payment date
     status = current_user.subscription_status
@@ -267,27 +218,10 @@ def analytics():
     start_date = end_date - timedelta(days=30)  # Last 30 days by default
     
     # Get generations by date
-    generations_by_date = db.session.query(
-        db.func.date(Generation.timestamp).label('date'),
-        db.func.count().label('count')
-    ).filter(
-        Generation.user_id == current_user.id,
-        Generation.timestamp.between(start_date, end_date)
-    ).group_by(
-        db.func.date(Generation.timestamp)
-    ).all()
+    generations_by_date = queries.generations_by_date(current_user.id, start_date, end_date).all()
     
     # Get generations by country
-    generations_by_country = db.session.query(
-        Generation.country,
-        db.func.count().label('count')
-    ).filter(
-        Generation.user_id == current_user.id
-    ).group_by(
-        Generation.country
-    ).order_by(
-        db.desc('count')
-    ).limit(10).all()
+    generations_by_country = queries.generations_by_country(current_user.id).all()
     
     # Format data for charts
     dates = []
@@ -303,15 +237,9 @@ def analytics():
         country_counts.append(count)
     
     # Get most viewed/downloaded generations
-    most_viewed = Generation.query.filter_by(user_id=current_user.id)\
-        .order_by(Generation.view_count.desc())\
-        .limit(5)\
-        .all()
+    most_viewed = queries.most_viewed(current_user.id).all()
     
-    most_downloaded = Generation.query.filter_by(user_id=current_user.id)\
-        .order_by(Generation.download_count.desc())\
-        .limit(5)\
-        .all()
+    most_downloaded = queries.most_downloaded(current_user.id).all()
     
     return render_template('dashboard/analytics.html',
                           dates=dates,
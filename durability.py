@@ -0,0 +1,159 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# How long the writer collects paths before syncing them as one batch
+FSYNC_BATCH_SECONDS = float(os.getenv("FSYNC_BATCH_MS", 50)) / 1000
+FSYNC_ENABLED = os.getenv("FSYNC_ENABLED", "True") == "True"
+
+
+def fsync_file(path: str) -> None:
+    """Flush a file's data to disk (no-op when FSYNC_ENABLED is off)."""
+    if not FSYNC_ENABLED:
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FsyncWriter:
+    """
+    Background thread that makes the renames of published outputs durable.
+
+    Request threads fsync each file before renaming it into place (fsync_file), so
+    a renamed entry never points at missing data. Only the fsync of the parent
+    directories, which persists the renames themselves, is handed to this writer
+    and batched, so the HTTP response does not wait for it.
+    """
+
+    def __init__(self, batch_seconds: float = FSYNC_BATCH_SECONDS):
+        self.batch_seconds = batch_seconds
+        self.batches = 0
+        self.directories = 0
+        self.errors = 0
+        self.sync_seconds = 0.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="fsync-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, paths: Iterable[str]) -> None:
+        """Queue the parent directories of renamed files to be fsynced."""
+        for path in paths:
+            self._queue.put(path)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._sync(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _sync(self, paths) -> None:
+        start = time.perf_counter()
+        directories = {os.path.dirname(path) for path in paths}
+        errors = 0
+        for path in sorted(directories):
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                # Removed before the batch ran; nothing left to sync
+                continue
+            try:
+                os.fsync(fd)
+            except OSError:
+                errors += 1
+                logger.exception("fsync failed for %s", path)
+            finally:
+                os.close(fd)
+        with self._lock:
+            self.batches += 1
+            self.directories += len(directories)
+            self.errors += errors
+            self.sync_seconds += time.perf_counter() - start
+
+    def flush(self) -> None:
+        """Block until everything submitted so far has been synced."""
+        self._queue.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "batches": self.batches,
+                "directories": self.directories,
+                "errors": self.errors,
+                "avg_batch_seconds": round(self.sync_seconds / self.batches, 6) if self.batches else 0.0
+            }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_fsync_writer() -> FsyncWriter:
+    """Return the process-wide fsync writer, starting it on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = FsyncWriter()
+                atexit.register(_writer.flush)
+    return _writer
+
+
+def sync_later(paths: Iterable[str]) -> None:
+    """
+    Persist the renames of files in the background (no-op when FSYNC_ENABLED is off).
+
+    The files' own data must already have been synced with fsync_file before the rename.
+    """
+    if FSYNC_ENABLED:
+        get_fsync_writer().submit(paths)
+
+
+_stage_lock = threading.Lock()
+_stage_stats = {}
+
+
+def record_write_stage(stage: str, seconds: float) -> None:
+    """Accumulate latency of one save_outputs write stage."""
+    with _stage_lock:
+        stats = _stage_stats.setdefault(stage, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["count"] += 1
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+def get_write_stats() -> dict:
+    """Per-stage write latency plus the state of the background fsync writer."""
+    with _stage_lock:
+        stages = {
+            stage: {
+                "count": stats["count"],
+                "avg_seconds": round(stats["total_seconds"] / stats["count"], 6),
+                "max_seconds": round(stats["max_seconds"], 6)
+            }
+            for stage, stats in _stage_stats.items()
+        }
+    return {
+        "stages": stages,
+        "fsync": get_fsync_writer().stats() if FSYNC_ENABLED else None
+    }
@@ -1,37 +1,198 @@
-import requests
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 from dotenv import load_dotenv
+from provider_clients import get_http_session, get_timeout
 
 load_dotenv()
 
+VOICE_RSS_URL = "http://api.voicerss.org/"
+AUDIO_FORMAT = '44khz_16bit_stereo'
+# Longest piece of text sent in one VoiceRSS request, and how many pieces are synthesized at once
+CHUNK_MAX_CHARS = int(os.getenv("VOICE_RSS_CHUNK_CHARS", 800))
+CHUNK_WORKERS = int(os.getenv("VOICE_RSS_CHUNK_WORKERS", 4))
+
+# Cap concurrent VoiceRSS requests so parallel generations stay within the provider's limits
+_voicerss_slots = threading.BoundedSemaphore(int(os.getenv("VOICE_RSS_MAX_CONCURRENCY", 4)))
+
+# MPEG audio bitrate (kbps) tables for Layer III, indexed by the header's bitrate bits
+_MPEG1_L3_BITRATES = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0]
+_MPEG2_L3_BITRATES = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0]
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def split_text(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    """
+    Splits text into chunks of at most max_chars, breaking on sentence boundaries.
+
+    Sentences longer than max_chars are broken on whitespace.
+    """
+    chunks = []
+    current = ""
+    for sentence in re.split(r'(?<=[.!?…])\s+', text.strip()):
+        pieces = [sentence]
+        if len(sentence) > max_chars:
+            pieces = []
+            piece = ""
+            for word in sentence.split():
+                if piece and len(piece) + 1 + len(word) > max_chars:
+                    pieces.append(piece)
+                    piece = word
+                else:
+                    piece = f"{piece} {word}" if piece else word
+            if piece:
+                pieces.append(piece)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _synthesize(text: str, api_key: str, language: str, codec: str, output_file: str) -> None:
+    """Requests one piece of speech from VoiceRSS and streams it to output_file."""
+    params = {
+        'key': api_key,
+        'src': text,
+        'hl': language,
+        'c': codec,
+        'f': AUDIO_FORMAT
+    }
+    # POST keeps the text out of the URL, which VoiceRSS and proxies limit in length
+    with _voicerss_slots:
+        response = get_http_session("voicerss").post(
+            VOICE_RSS_URL, data=params, timeout=get_timeout("voicerss"), stream=True
+        )
+        try:
+            if response.status_code != 200:
+                raise RuntimeError(response.text)
+            chunks = response.iter_content(chunk_size=64 * 1024)
+            first = next(chunks, b"")
+            # VoiceRSS reports errors as a 200 response with an "ERROR: ..." body
+            if first.startswith(b"ERROR"):
+                raise RuntimeError(first.decode("utf-8", "replace"))
+            with open(output_file, "wb") as audio_file:
+                audio_file.write(first)
+                for chunk in chunks:
+                    audio_file.write(chunk)
+        finally:
+            response.close()
+
+
+def _mp3_frame_range(path: str) -> Tuple[int, int]:
+    """
+    Returns the (start, end) byte range of the MPEG audio frames in an MP3 file.
+
+    Skips a leading ID3v2 tag, a LAME/Xing "Info" header frame (whose frame count
+    would be wrong once files are joined) and a trailing ID3v1 tag.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = 0
+        header = f.read(10)
+        if header[:3] == b"ID3" and len(header) == 10:
+            # Syncsafe tag size, plus the footer if present
+            tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+            start = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+        f.seek(start)
+        frame = f.read(4)
+        frame_length = _mp3_frame_length(frame)
+        if frame_length:
+            f.seek(start)
+            body = f.read(min(frame_length, 64))
+            if b"Xing" in body or b"Info" in body:
+                start += frame_length
+
+        end = size
+        if size - start >= 128:
+            f.seek(size - 128)
+            if f.read(3) == b"TAG":
+                end = size - 128
+    return start, end
+
+
+def _mp3_frame_length(header: bytes) -> int:
+    """Returns the length of the Layer III frame starting with header, or 0 if it is not one."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return 0
+    version = (header[1] >> 3) & 0x03  # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+    layer = (header[1] >> 1) & 0x03  # 1 = Layer III
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version == 1 or layer != 1 or sample_rate_index == 3:
+        return 0
+    bitrates = _MPEG1_L3_BITRATES if version == 3 else _MPEG2_L3_BITRATES
+    bitrate = bitrates[bitrate_index] * 1000
+    if not bitrate:
+        return 0
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    samples_factor = 144 if version == 3 else 72
+    return samples_factor * bitrate // sample_rate + padding
+
+
+def _join_mp3_parts(part_files: List[str], output_file: str) -> None:
+    """Concatenates MP3 files at frame level (no re-encoding) into output_file."""
+    tmp_file = output_file + ".part"
+    with open(tmp_file, "wb") as out:
+        for part in part_files:
+            start, end = _mp3_frame_range(part)
+            with open(part, "rb") as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    block = f.read(min(64 * 1024, remaining))
+                    if not block:
+                        break
+                    out.write(block)
+                    remaining -= len(block)
+    os.replace(tmp_file, output_file)
+
+
 def text_to_speech(text: str, api_key: str, language: str = 'en-us', codec: str = 'MP3', output_file: str = "voiceover.mp3") -> None:
     """
     Converts text to speech using the Voice RSS API and saves the result as an audio file.
-    
+
+    Long MP3 voiceovers are split on sentence boundaries, synthesized concurrently and
+    joined frame by frame, so nothing larger than a network buffer is held in memory.
+
     Args:
         text (str): The text to be converted to speech.
         api_key (str): Your Voice RSS API key.
         language (str): The language code (default 'en-us').
         codec (str): The audio codec to use (default 'MP3').
         output_file (str): The file path where the audio will be saved.
+
+    Raises:
+        RuntimeError: If VoiceRSS rejects a chunk; network errors propagate as well.
     """
-    url = "http://api.voicerss.org/"
-    params = {
-        'key': api_key,
-        'src': text,
-        'hl': language,
-        'c': codec,
-        'f': '44khz_16bit_stereo'
-    }
-    
-    response = requests.get(url, params=params)
-    
-    if response.status_code == 200:
-        with open(output_file, "wb") as audio_file:
-            audio_file.write(response.content)
-        print(f"Voiceover saved as '{output_file}'")
+    # Only MP3 frames can be joined without re-encoding
+    chunks = split_text(text) if codec.upper() == 'MP3' else [text]
+    if len(chunks) <= 1:
+        _synthesize(text, api_key, language, codec, output_file)
     else:
-        print("Error:", response.text)
+        part_files = [f"{output_file}.{index:03d}" for index in range(len(chunks))]
+        try:
+            with ThreadPoolExecutor(max_workers=CHUNK_WORKERS) as executor:
+                futures = [
+                    executor.submit(_synthesize, chunk, api_key, language, codec, part_file)
+                    for chunk, part_file in zip(chunks, part_files)
+                ]
+                for future in futures:
+                    future.result()
+            _join_mp3_parts(part_files, output_file)
+        finally:
+            for part_file in part_files:
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+    print(f"Voiceover saved as '{output_file}' ({len(chunks)} chunk(s))")
 
 # Example usage remains unchanged.
 if __name__ == "__main__":
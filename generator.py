@@ -1,12 +1,22 @@
 import os
 import json
+import time
+import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from llm_integration import call_llm,call_llm_gorq
+from llm_integration import stream_llm_gorq
+from llm_router import route_llm
 from generate_voiceover import text_to_speech
-import ast  # To safely convert the LLM’s output string to a dictionary
+from tts_cache import get_audio_store
+from artifacts import PACK_NAME, AUDIO_ARTIFACT, add_encoded_variants, write_pack, write_bundle, create_staging_dir, publish_staged
+import history_index
+from content_cache import invalidate_generation
+from durability import fsync_file, record_write_stage, sync_later
+from storage import get_storage, resolve_generation_dir, write_etag
 #from flux_image_generator import YouTubeShortsImageGenerator
-from prompts import get_image_prompt_dict
+from prompts import SCENE_OUTPUT_FORMAT
+from scene_parser import get_scene_dict
 import re
 
 
@@ -14,10 +24,70 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# Stage name -> names of the stages whose output it needs.
+STAGE_DEPENDENCIES = {
+    "story": (),
+    "voiceover": ("story",),
+    "scenes": ("story",),
+}
+
+
+def run_stages(stages: dict, dependencies: dict, max_workers: int = 4, on_event=None) -> dict:
+    """
+    Runs a small DAG of stages, starting each one as soon as its dependencies have finished.
+
+    Args:
+        stages (dict): Stage name -> zero-argument callable.
+        dependencies (dict): Stage name -> iterable of stage names it depends on.
+        max_workers (int): Maximum number of stages running at once.
+        on_event (callable, optional): Called as on_event(stage, status, seconds) when a stage
+            starts ("running"), finishes ("done") or raises ("failed"). Always invoked from the
+            calling thread, so it may safely use the caller's database session.
+
+    Returns:
+        dict: Stage name -> wall-clock duration in seconds.
+    """
+    timings = {}
+    done = set()
+    pending = dict(stages)
+    running = {}
+
+    def timed(name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        finally:
+            timings[name] = round(time.perf_counter() - start, 3)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                if all(dep in done for dep in dependencies.get(name, ())):
+                    running[executor.submit(timed, name, pending.pop(name))] = name
+                    if on_event:
+                        on_event(name, "running", None)
+            if not running:
+                raise ValueError(f"Unresolvable stage dependencies: {sorted(pending)}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    if on_event:
+                        on_event(name, "failed", timings.get(name))
+                    # Re-raise the first stage failure; stages already running are left to finish.
+                    raise future.exception()
+                done.add(name)
+                if on_event:
+                    on_event(name, "done", timings[name])
+                logger.info("Stage %s finished in %.3fs", name, timings[name])
+    return timings
+
+
 class YouTubeShortsGenerator:
     """Handles the generation of folk story YouTube Shorts content, including voiceover TTS conversion."""
     
-    def __init__(self):
+    def __init__(self, output_dir: str = os.path.join("static", "outputs")):
+        self.output_dir = output_dir  # Local folder the generation directories are resolved under
         self.country_name = ""
         self.story_content = ""
         self.voiceover_script = ""
@@ -25,6 +95,9 @@ class YouTubeShortsGenerator:
         self.scene_prompts = ""
         self.images = {} 
         self.generation_id = ""
+        self.stage_timings = {}
+        self.write_timings = {}  # Seconds spent in each save_outputs write stage
+        self.progress_callback = None  # Optional on_event hook passed to run_stages
         
     def set_country(self, country: str) -> None:
         """Set the country and generate a unique ID for this generation."""
@@ -43,12 +116,17 @@ class YouTubeShortsGenerator:
     
     def _create_scene_prompt(self) -> str:
         # Your existing implementation to create the scene prompt based on self.story_content
-        return f"Break down the following folk story into numbered scenes with detailed image prompts:\n\n{self.story_content}"
+        return (
+            f"Break down the following folk story into numbered scenes with detailed image prompts:\n\n{self.story_content}\n"
+            f"{SCENE_OUTPUT_FORMAT}"
+        )
     
     def generate_story(self) -> str:
         """Generate the folk story."""
         logger.info("Generating folk story for %s", self.country_name)
-        response = call_llm_gorq(self._create_story_prompt())
+        # The story prompt depends only on the country, so caching it would replay the
+        # same story for every generation; derived stages are keyed on the story text.
+        response = route_llm(self._create_story_prompt(), use_cache=False)
         self.story_content = response.strip()
         if not self.story_content:
             error_msg = "Failed to generate story content."
@@ -63,7 +141,7 @@ class YouTubeShortsGenerator:
             raise ValueError("Story content must be generated first.")
         
         logger.info("Generating voiceover script")
-        response = call_llm_gorq(self._create_voiceover_prompt())
+        response = route_llm(self._create_voiceover_prompt())
         self.voiceover_script = response.strip()
         if not self.voiceover_script:
             error_msg = "Failed to generate voiceover script."
@@ -71,23 +149,70 @@ class YouTubeShortsGenerator:
             raise ValueError(error_msg)
         logger.info("Voiceover script generation completed")
         
+        self.synthesize_voiceover()
+        return self.voiceover_script
+
+    def stream_story(self):
+        """Generate the folk story, yielding text as the model produces it."""
+        logger.info("Streaming folk story for %s", self.country_name)
+        parts = []
+        for token in stream_llm_gorq(self._create_story_prompt(), use_cache=False):
+            parts.append(token)
+            yield token
+        self.story_content = "".join(parts).strip()
+        if not self.story_content:
+            error_msg = "Failed to generate story content."
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        logger.info("Story generation completed")
+
+    def stream_voiceover_script(self):
+        """Generate the voiceover script, yielding text as the model produces it.
+
+        Call synthesize_voiceover() afterwards to produce the TTS audio.
+        """
+        if not self.story_content:
+            raise ValueError("Story content must be generated first.")
+        
+        logger.info("Streaming voiceover script")
+        parts = []
+        for token in stream_llm_gorq(self._create_voiceover_prompt()):
+            parts.append(token)
+            yield token
+        self.voiceover_script = "".join(parts).strip()
+        if not self.voiceover_script:
+            error_msg = "Failed to generate voiceover script."
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        logger.info("Voiceover script generation completed")
+
+    def synthesize_voiceover(self) -> str:
+        """Convert the voiceover script to speech using TTS."""
+        if not self.voiceover_script:
+            raise ValueError("Voiceover script must be generated first.")
+        
         # Generate TTS audio from the voiceover script
         voice_rss_api_key = os.getenv("VOICE_RSS_API_KEY")
         if not voice_rss_api_key:
             raise ValueError("VOICE_RSS_API_KEY is not set")
         
         # Determine output path for the TTS audio file
-        gen_dir = os.path.join("static", "outputs", self.generation_id)
+        gen_dir = resolve_generation_dir(self.output_dir, self.generation_id)
         os.makedirs(gen_dir, exist_ok=True)
         tts_output_path = os.path.join(gen_dir, "voiceover_tts.mp3")
         
-        # Call the TTS function (make sure text_to_speech accepts an output_file parameter)
-        text_to_speech(self.voiceover_script, voice_rss_api_key, output_file=tts_output_path)
+        # Reuse stored audio for identical scripts; call the TTS API only on a miss
+        get_audio_store().fetch(
+            self.voiceover_script, 'en-us', 'MP3', tts_output_path,
+            lambda path: text_to_speech(self.voiceover_script, voice_rss_api_key, output_file=path)
+        )
+        if not os.path.isfile(tts_output_path) or os.path.getsize(tts_output_path) == 0:
+            raise RuntimeError("Voiceover TTS produced no audio")
         
-        self.voiceover_tts_path = f"/static/outputs/{self.generation_id}/voiceover_tts.mp3"
+        self.voiceover_tts_path = f"/outputs/{self.generation_id}/voiceover_tts.mp3"
         logger.info("Voiceover TTS audio generated at %s", self.voiceover_tts_path)
         
-        return self.voiceover_script
+        return self.voiceover_tts_path
 
     def generate_scene_prompts(self) -> str:
         """Generate image prompts for each scene."""
@@ -95,7 +220,7 @@ class YouTubeShortsGenerator:
             raise ValueError("Story content must be generated first.")
         
         logger.info("Generating scene image prompts")
-        response = call_llm_gorq(self._create_scene_prompt())
+        response = route_llm(self._create_scene_prompt())
         self.scene_prompts = response.strip()
         if not self.scene_prompts:
             error_msg = "Failed to generate scene prompts."
@@ -109,24 +234,14 @@ class YouTubeShortsGenerator:
         if not self.scene_prompts:
             raise ValueError("Scene prompts must be generated first.")
     
-        # Convert scene prompts text to a dictionary using LLM
-        image_prompt_conversion = call_llm_gorq(get_image_prompt_dict(self.scene_prompts)).strip()
-        # Remove "python" if it's at the start of the response
-        image_prompt_intermediate = image_prompt_conversion.removeprefix("```python")
-        image_prompt_final = image_prompt_intermediate.removesuffix("```")
-        
-
-        print(image_prompt_final)
-        try:
-            scene_dict = ast.literal_eval(image_prompt_final)
-        except Exception as e:
-            raise ValueError("Failed to convert scene prompts to dictionary: " + str(e))
+        # Convert scene prompts text to a dictionary (parsed locally, LLM only as a fallback)
+        scene_dict = get_scene_dict(self.scene_prompts)
     
         #image_generator = YouTubeShortsImageGenerator()
         self.images = {}
     
         # Create generation output directory
-        gen_dir = os.path.join("static", "outputs", self.generation_id)
+        gen_dir = resolve_generation_dir(self.output_dir, self.generation_id)
         os.makedirs(gen_dir, exist_ok=True)
     
         for scene_id, prompt_obj in scene_dict.items():
@@ -145,44 +260,64 @@ class YouTubeShortsGenerator:
 
 
     def generate_all(self) -> dict:
-        """Generate all components of the YouTube Short."""
-        self.generate_story()
-        self.generate_voiceover()
-        self.generate_scene_prompts()
-        #self.generate_images()   # Generate images for each scene
+        """Generate all components of the YouTube Short.
+
+        Voiceover and scene prompts only depend on the story, so they run concurrently.
+        """
+        stages = {
+            "story": self.generate_story,
+            "voiceover": self.generate_voiceover,
+            "scenes": self.generate_scene_prompts,
+            #"images": self.generate_images,   # Generate images for each scene
+        }
+        start = time.perf_counter()
+        self.stage_timings = run_stages(stages, STAGE_DEPENDENCIES, on_event=self.progress_callback)
+        self.stage_timings["total"] = round(time.perf_counter() - start, 3)
         return {
             "country": self.country_name,
             "generation_id": self.generation_id,
             "story": self.story_content,
             "voiceover": self.voiceover_script,
             "voiceover_tts": self.voiceover_tts_path,
-            "scenes": self.scene_prompts
+            "scenes": self.scene_prompts,
             #"images": self.images   # Include the images in the output
+            "stage_timings": self.stage_timings
         }
 
-    def save_outputs(self, output_dir: str) -> dict:
-        """Save all generated content to files and return their paths."""
-        gen_dir = os.path.join(output_dir, self.generation_id)
+    def _timed_write(self, stage: str, start: float) -> float:
+        seconds = time.perf_counter() - start
+        self.write_timings[stage] = round(seconds, 6)
+        record_write_stage(stage, seconds)
+        return time.perf_counter()
+
+    def save_outputs(self, output_dir: str, bundle: bool = False) -> dict:
+        """Save all generated content to files and return their paths.
+
+        Artifacts are written to a staging directory, fsynced and published with an
+        atomic rename; only the directory fsync is left to the background writer.
+        The published files are then handed to the application's storage backend.
+
+        Args:
+            output_dir: Folder holding one directory per generation.
+            bundle: Also write the "download all" zip archive.
+        """
+        gen_dir = resolve_generation_dir(output_dir, self.generation_id)
         os.makedirs(gen_dir, exist_ok=True)
+        staging_dir = None
+        self.write_timings = {}
         try:
-            # Save story
+            start = time.perf_counter()
             story_path = os.path.join(gen_dir, "story.txt")
-            with open(story_path, "w", encoding="utf-8") as f:
-                f.write(self.story_content)
-            # Save voiceover script
             voiceover_path = os.path.join(gen_dir, "voiceover.txt")
-            with open(voiceover_path, "w", encoding="utf-8") as f:
-                f.write(self.voiceover_script)
-            # Save scene prompts
             scenes_path = os.path.join(gen_dir, "scenes.txt")
-            with open(scenes_path, "w", encoding="utf-8") as f:
-                f.write(self.scene_prompts)
-            # Create metadata file
+            # Create metadata
             metadata = {
                     "country": self.country_name,
                     "generation_id": self.generation_id,
                     "timestamp": datetime.now().isoformat(),
+                    "stage_timings": self.stage_timings,
                     "files": {
+                        "pack": os.path.join(gen_dir, PACK_NAME),
                         "story": story_path,
                         "voiceover": voiceover_path,
                         "voiceover_tts": os.path.join(gen_dir, "voiceover_tts.mp3"),
@@ -190,11 +325,54 @@ class YouTubeShortsGenerator:
                         "images": self.images   # New field for images
                         }
                     }
-            metadata_path = os.path.join(gen_dir, "metadata.json")
-            with open(metadata_path, "w", encoding="utf-8") as f:
-                json.dump(metadata, f, indent=2)
+            entries = {
+                "story.txt": self.story_content.encode("utf-8"),
+                "voiceover.txt": self.voiceover_script.encode("utf-8"),
+                "scenes.txt": self.scene_prompts.encode("utf-8"),
+                "metadata.json": json.dumps(metadata).encode("utf-8")
+            }
+            start = self._timed_write("serialize", start)
+            entries = add_encoded_variants(entries)
+            start = self._timed_write("compress", start)
+            
+            # Story, voiceover script, scene prompts and metadata go into one packed file
+            staging_dir = create_staging_dir(output_dir, self.generation_id)
+            write_pack(os.path.join(staging_dir, PACK_NAME), entries)
+            start = self._timed_write("stage", start)
+            
+            published = publish_staged(staging_dir, gen_dir)
+            staging_dir = None
+            start = self._timed_write("publish", start)
+            
+            if bundle:
+                published.append(write_bundle(output_dir, self.generation_id))
+                start = self._timed_write("bundle", start)
+            audio_path = os.path.join(gen_dir, AUDIO_ARTIFACT)
+            if os.path.exists(audio_path):
+                # Written in place by the TTS step rather than staged
+                fsync_file(audio_path)
+                write_etag(audio_path)
+                published.append(audio_path)
+                
+            # Hand the local working copy to the storage backend (a no-op for local storage)
+            storage = get_storage()
+            for path in published:
+                storage.save(self.generation_id, os.path.basename(path), path)
+            invalidate_generation(self.generation_id)
+            if storage.is_local:
+                sync_later(published)
+            else:
+                shutil.rmtree(gen_dir, ignore_errors=True)
+            start = self._timed_write("upload", start)
+                
+            # A failed index update must not lose the generation; rebuild-history-index repairs it
+            try:
+                history_index.record_generation(output_dir, metadata)
+            except Exception:
+                logger.exception("Failed to update history index for %s", self.generation_id)
+            self._timed_write("index", start)
                 
-            logger.info("All outputs saved to %s", gen_dir)
+            logger.info("All outputs saved to %s (write timings: %s)", gen_dir, self.write_timings)
             return {
                 "generation_id": self.generation_id,
                 "story_path": f"/outputs/{self.generation_id}/story.txt",
@@ -206,3 +384,6 @@ class YouTubeShortsGenerator:
         except Exception as e:
             logger.exception("Error saving outputs:")
             raise
+        finally:
+            if staging_dir:
+                shutil.rmtree(staging_dir, ignore_errors=True)
@@ -0,0 +1,190 @@
+import os
+import json
+import sqlite3
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from artifacts import read_artifact
+from storage import LocalStorage, iter_generation_dirs
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "history_index.sqlite3"
+# PRAGMA user_version of an index that was filled from the output folder at least once
+_BOOTSTRAPPED = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    generation_id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_history_timestamp ON history (timestamp, generation_id);
+CREATE TABLE IF NOT EXISTS history_stats (id INTEGER PRIMARY KEY CHECK (id = 1), total INTEGER NOT NULL);
+INSERT OR IGNORE INTO history_stats (id, total) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS history_count_insert AFTER INSERT ON history
+    BEGIN UPDATE history_stats SET total = total + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS history_count_delete AFTER DELETE ON history
+    BEGIN UPDATE history_stats SET total = total - 1 WHERE id = 1; END;
+"""
+
+
+_initialized = set()
+
+
+def _scan_entries(output_dir: str) -> dict:
+    """generation_id -> index row of every generation with metadata in the output folder."""
+    local = LocalStorage(output_dir)
+    entries = {}
+    for generation_id, _ in iter_generation_dirs(output_dir):
+        try:
+            metadata = read_artifact(generation_id, "metadata.json", local)
+        except Exception:
+            logger.exception("Skipping unreadable generation %s", generation_id)
+            continue
+        if metadata is None:
+            continue
+        metadata = json.loads(metadata)
+        generation_id = metadata.get("generation_id", generation_id)
+        entries[generation_id] = (generation_id, metadata.get("timestamp", ""), json.dumps(metadata))
+    return entries
+
+
+def _bootstrap(conn: sqlite3.Connection, output_dir: str) -> None:
+    """
+    Index the generations already in the output folder, once per index.
+
+    Deployments upgraded from the directory-walking /history have generations
+    but no index; rows already indexed are kept as they are.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= _BOOTSTRAPPED:
+        return
+    entries = _scan_entries(output_dir)
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO history (generation_id, timestamp, metadata) VALUES (?, ?, ?)",
+                         entries.values())
+        conn.execute(f"PRAGMA user_version = {_BOOTSTRAPPED}")
+    logger.info("History index bootstrapped with %d existing generations", len(entries))
+
+
+def _connect(output_dir: str) -> sqlite3.Connection:
+    path = os.path.join(output_dir, INDEX_NAME)
+    conn = sqlite3.connect(path, timeout=5)
+    if path not in _initialized:
+        conn.executescript(_SCHEMA)
+        _bootstrap(conn, output_dir)
+        _initialized.add(path)
+    return conn
+
+
+def record_generation(output_dir: str, metadata: dict) -> None:
+    """Add or update a generation in the history index."""
+    conn = _connect(output_dir)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO history (generation_id, timestamp, metadata) VALUES (?, ?, ?) "
+                "ON CONFLICT (generation_id) DO UPDATE SET timestamp = excluded.timestamp, metadata = excluded.metadata",
+                (metadata["generation_id"], metadata.get("timestamp", ""), json.dumps(metadata))
+            )
+    finally:
+        conn.close()
+
+
+def remove_generation(output_dir: str, generation_id: str) -> None:
+    """Drop a generation from the history index."""
+    conn = _connect(output_dir)
+    try:
+        with conn:
+            conn.execute("DELETE FROM history WHERE generation_id = ?", (generation_id,))
+    finally:
+        conn.close()
+
+
+def encode_cursor(metadata: dict) -> str:
+    return f"{metadata.get('timestamp', '')}|{metadata['generation_id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Split a cursor made by encode_cursor into (timestamp, generation_id).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    timestamp, separator, generation_id = cursor.partition("|")
+    if not separator or not generation_id:
+        raise ValueError(f"Malformed history cursor: {cursor!r}")
+    if timestamp:
+        # Raises ValueError for anything but an ISO timestamp
+        datetime.fromisoformat(timestamp)
+    return timestamp, generation_id
+
+
+def get_history_page(output_dir: str, per_page: int = 12, before: Optional[Tuple[str, str]] = None,
+                     after: Optional[Tuple[str, str]] = None) -> Tuple[List[dict], int, bool, bool]:
+    """
+    Return one page of history, newest first, using keyset pagination.
+
+    Args:
+        before: Decoded cursor of the last item of the previous page (to page towards older items).
+        after: Decoded cursor of the first item of the next page (to page back towards newer items).
+
+    Returns:
+        tuple: (items, total, has_newer, has_older)
+    """
+    conn = _connect(output_dir)
+    try:
+        total = conn.execute("SELECT total FROM history_stats WHERE id = 1").fetchone()[0]
+        if after:
+            timestamp, generation_id = after
+            rows = conn.execute(
+                "SELECT metadata FROM history WHERE (timestamp, generation_id) > (?, ?) "
+                "ORDER BY timestamp ASC, generation_id ASC LIMIT ?",
+                (timestamp, generation_id, per_page + 1)
+            ).fetchall()
+            has_newer = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            has_older = True
+        else:
+            if before:
+                timestamp, generation_id = before
+                rows = conn.execute(
+                    "SELECT metadata FROM history WHERE (timestamp, generation_id) < (?, ?) "
+                    "ORDER BY timestamp DESC, generation_id DESC LIMIT ?",
+                    (timestamp, generation_id, per_page + 1)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT metadata FROM history ORDER BY timestamp DESC, generation_id DESC LIMIT ?",
+                    (per_page + 1,)
+                ).fetchall()
+            has_older = len(rows) > per_page
+            rows = rows[:per_page]
+            has_newer = before is not None
+    finally:
+        conn.close()
+
+    return [json.loads(row[0]) for row in rows], total, has_newer, has_older
+
+
+def rebuild_index(output_dir: str) -> int:
+    """
+    Rebuild the history index from the metadata stored in the output folder.
+
+    Returns:
+        int: Number of generations indexed.
+    """
+    entries = _scan_entries(output_dir)
+
+    conn = _connect(output_dir)
+    try:
+        with conn:
+            conn.execute("DELETE FROM history")
+            conn.executemany("INSERT INTO history (generation_id, timestamp, metadata) VALUES (?, ?, ?)", entries.values())
+            conn.execute(f"PRAGMA user_version = {_BOOTSTRAPPED}")
+    finally:
+        conn.close()
+    logger.info("History index rebuilt with %d generations", len(entries))
+    return len(entries)
@@ -0,0 +1,287 @@
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from models import db, User, Generation, GenerationJob, GenerationBatch, GENERATION_LIMITS, current_generation_period
+from generator import YouTubeShortsGenerator
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_batch_executor = None
+_app = None
+
+
+def init_job_queue(app):
+    """
+    Start the background worker pools and re-queue jobs left over from a previous process.
+
+    Must be called after the database tables exist.
+    """
+    global _executor, _batch_executor, _app
+    _app = app
+    _executor = ThreadPoolExecutor(
+        max_workers=app.config.get('JOB_WORKERS', 2),
+        thread_name_prefix='generation-job'
+    )
+    # Batch items get their own, bounded pool so a large batch cannot starve single jobs
+    # or exceed the providers' concurrency limits
+    _batch_executor = ThreadPoolExecutor(
+        max_workers=app.config.get('BATCH_WORKERS', 3),
+        thread_name_prefix='generation-batch'
+    )
+
+    with app.app_context():
+        # Jobs still "running" long after they started belonged to a worker that died
+        stale_before = datetime.utcnow() - timedelta(seconds=app.config.get('JOB_STALE_SECONDS', 900))
+        GenerationJob.query.filter(
+            GenerationJob.status == 'running',
+            GenerationJob.started_at < stale_before
+        ).update({'status': 'queued'}, synchronize_session=False)
+        db.session.commit()
+
+        queued = [(job.job_id, job.batch_id) for job in GenerationJob.query.filter_by(status='queued').all()]
+        open_batches = [batch.batch_id for batch in GenerationBatch.query.filter_by(status='running').all()]
+
+    for job_id, batch_id in queued:
+        _submit(job_id, batch_id)
+    if queued:
+        logger.info("Re-queued %d pending generation jobs", len(queued))
+
+    # Batches whose last item finished just before a crash still need finalising
+    for batch_id in open_batches:
+        with app.app_context():
+            _finalize_batch(batch_id)
+
+
+def _submit(job_id, batch_id=None):
+    executor = _batch_executor if batch_id else _executor
+    executor.submit(run_generation_job, job_id)
+
+
+def _reserve_generations(user, count):
+    """
+    Add count generations to the user's monthly counter if their plan's limit allows it.
+
+    The limit check and the increment are one conditional UPDATE, so concurrent
+    submissions cannot together go over the limit. The caller commits.
+
+    Returns:
+        bool: True if the generations were reserved.
+    """
+    period = current_generation_period()
+    # A counter stamped with an earlier month starts over from zero
+    used = db.case((User.generations_period == period, User.monthly_generations), else_=0)
+    query = User.query.filter(User.id == user.id)
+    limit = GENERATION_LIMITS.get(user.subscription_tier, 0)
+    if limit != float('inf'):
+        query = query.filter(used + count <= limit)
+    reserved = query.update(
+        {'monthly_generations': used + count, 'generations_period': period},
+        synchronize_session=False
+    )
+    return reserved == 1
+
+
+def _released_generations(count, reserved_at):
+    """
+    New monthly counter value after giving back count generations reserved at reserved_at.
+
+    Reservations are released against the month they were made in; if a new month
+    started since, they were already dropped with the old counter.
+    """
+    reserved_in = User.generations_period == reserved_at.strftime('%Y-%m')
+    return db.case(
+        (reserved_in & (User.monthly_generations > count), User.monthly_generations - count),
+        (reserved_in, 0),
+        else_=User.monthly_generations
+    )
+
+
+def submit_generation_job(user, country):
+    """
+    Persist a new generation job for the user and hand it to the worker pool.
+
+    One generation of the monthly quota is reserved with the job and given back if it fails.
+
+    Returns:
+        GenerationJob: Or None if the user has no generations left this month.
+    """
+    if _executor is None:
+        raise RuntimeError("Job queue has not been initialised")
+
+    if not _reserve_generations(user, 1):
+        db.session.rollback()
+        return None
+    job = GenerationJob(
+        job_id=uuid.uuid4().hex,
+        user_id=user.id,
+        country=country
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _submit(job.job_id)
+    return job
+
+
+def submit_generation_batch(user, countries):
+    """
+    Persist a batch of generation jobs and fan them out over the bounded batch pool.
+
+    The batch's quota is reserved up front in a single conditional update; unused
+    reservations are released when the batch is finalised.
+
+    Returns:
+        tuple: (GenerationBatch, jobs), or None if the batch exceeds the generations
+            the user has left this month.
+    """
+    if _batch_executor is None:
+        raise RuntimeError("Job queue has not been initialised")
+
+    if not _reserve_generations(user, len(countries)):
+        db.session.rollback()
+        return None
+    batch = GenerationBatch(
+        batch_id=uuid.uuid4().hex,
+        user_id=user.id,
+        total=len(countries)
+    )
+    jobs = [
+        GenerationJob(job_id=uuid.uuid4().hex, batch_id=batch.batch_id, user_id=user.id, country=country)
+        for country in countries
+    ]
+    db.session.add(batch)
+    db.session.add_all(jobs)
+    db.session.commit()
+
+    for job in jobs:
+        _submit(job.job_id, batch.batch_id)
+    return batch, jobs
+
+
+def _claim_job(job_id):
+    """Atomically move a queued job to running so only one worker picks it up."""
+    claimed = GenerationJob.query.filter_by(job_id=job_id, status='queued').update(
+        {'status': 'running', 'started_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return claimed == 1
+
+
+def run_generation_job(job_id):
+    """Worker entry point: run the full generation pipeline for one job."""
+    with _app.app_context():
+        batch_id = None
+        try:
+            if not _claim_job(job_id):
+                return
+            job = GenerationJob.query.filter_by(job_id=job_id).first()
+            batch_id = job.batch_id
+            _execute_job(job)
+        except Exception as e:
+            logger.exception("Generation job %s failed:", job_id)
+            db.session.rollback()
+            job = GenerationJob.query.filter_by(job_id=job_id).first()
+            if job:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                if not job.batch_id:
+                    # Give back the generation reserved on submission (batches settle in _finalize_batch)
+                    User.query.filter_by(id=job.user_id).update(
+                        {'monthly_generations': _released_generations(1, job.created_at)},
+                        synchronize_session=False
+                    )
+                db.session.commit()
+        finally:
+            if batch_id:
+                _finalize_batch(batch_id)
+            db.session.remove()
+
+
+def _execute_job(job):
+    progress = {}
+
+    def record_progress(stage, status, seconds):
+        progress[stage] = {'status': status, 'seconds': seconds}
+        job.progress = json.dumps(progress)
+        db.session.commit()
+
+    generator = YouTubeShortsGenerator(_app.config['OUTPUT_FOLDER'])
+    generator.set_country(job.country)
+    generator.progress_callback = record_progress
+    generator.generate_all()
+
+    record_progress('save', 'running', None)
+    file_paths = generator.save_outputs(_app.config['OUTPUT_FOLDER'],
+                                       bundle=_app.config['ZIP_BUNDLE_MODE'] == 'precompute')
+    record_progress('save', 'done', None)
+
+    job.status = 'succeeded'
+    job.generation_id = generator.generation_id
+    job.file_paths = json.dumps(file_paths)
+    job.finished_at = datetime.utcnow()
+
+    # Batch items are recorded together when the whole batch finishes
+    if not job.batch_id:
+        db.session.add(_generation_for_job(job))
+        # The monthly count was reserved on submission
+        User.query.filter_by(id=job.user_id).update(
+            {'total_generations': User.total_generations + 1, 'last_generation_date': datetime.utcnow()},
+            synchronize_session=False
+        )
+
+    db.session.commit()
+    logger.info("Generation job %s completed (%s)", job.job_id, generator.generation_id)
+
+
+def _generation_for_job(job):
+    file_paths = json.loads(job.file_paths)
+    return Generation(
+        generation_id=job.generation_id,
+        user_id=job.user_id,
+        country=job.country,
+        story_path=file_paths['story_path'],
+        voiceover_path=file_paths['voiceover_path'],
+        voiceover_tts_path=file_paths['voiceover_tts_path'],
+        scenes_path=file_paths['scenes_path']
+    )
+
+
+def _finalize_batch(batch_id):
+    """Record all Generation rows of a finished batch and settle its quota reservation."""
+    unfinished = GenerationJob.query.filter(
+        GenerationJob.batch_id == batch_id,
+        GenerationJob.status.in_(['queued', 'running'])
+    ).count()
+    if unfinished:
+        return
+
+    # Only one worker may finalise: claim the batch atomically
+    claimed = GenerationBatch.query.filter_by(batch_id=batch_id, status='running').update(
+        {'status': 'completed', 'finished_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    if claimed != 1:
+        db.session.rollback()
+        return
+
+    jobs = GenerationJob.query.filter_by(batch_id=batch_id).all()
+    succeeded = [job for job in jobs if job.status == 'succeeded']
+    failed = len(jobs) - len(succeeded)
+
+    db.session.add_all([_generation_for_job(job) for job in succeeded])
+    user_id = jobs[0].user_id if jobs else None
+    if user_id:
+        # Release the reservations of failed items
+        changes = {'monthly_generations': _released_generations(failed, jobs[0].created_at)}
+        if succeeded:
+            changes['total_generations'] = User.total_generations + len(succeeded)
+            changes['last_generation_date'] = datetime.utcnow()
+        User.query.filter_by(id=user_id).update(changes, synchronize_session=False)
+    db.session.commit()
+    logger.info("Generation batch %s finished: %d succeeded, %d failed", batch_id, len(succeeded), failed)
@@ -1,23 +1,40 @@
 import os
 import re
 import json
+import threading
 import requests
 from dotenv import load_dotenv
-from groq import Groq
-from typing import Dict
+from typing import Dict, Iterator
+from llm_cache import get_llm_cache
+from provider_clients import get_groq_client, get_http_session, get_timeout
 
 load_dotenv()
 
-def call_llm(instruction: str) -> Dict[str, object]:
+GROQ_MODEL = "deepseek-r1-distill-llama-70b"
+OPENROUTER_MODEL = "qwen/qwen2.5-vl-72b-instruct:free"
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True") == "True"
+
+# Cap concurrent in-flight requests per provider so parallel generations stay within rate limits
+_groq_slots = threading.BoundedSemaphore(int(os.getenv("GROQ_MAX_CONCURRENCY", 4)))
+_openrouter_slots = threading.BoundedSemaphore(int(os.getenv("OPENROUTER_MAX_CONCURRENCY", 4)))
+
+def call_llm(instruction: str, use_cache: bool = True) -> Dict[str, object]:
     """
     Sends a POST request to the OpenRouter AI API for chat completions.
 
     Args:
         instruction (str): The instruction to send to the API.
+        use_cache (bool): Serve identical prompts from the response cache (default True).
 
     Returns:
         dict: Contains 'response_status' and 'response_text'.
     """
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = get_llm_cache().get("openrouter", OPENROUTER_MODEL, instruction)
+        if cached is not None:
+            return {"response_status": 200, "response_text": cached}
+
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not api_key:
         return {"response_status": None, "response_text": "Error: OPENROUTER_API_KEY not set"}
@@ -28,13 +45,16 @@ def call_llm(instruction: str) -> Dict[str, object]:
         "Content-Type": "application/json"
     }
     payload = {
-        "model": "qwen/qwen2.5-vl-72b-instruct:free",
+        "model": OPENROUTER_MODEL,
         "messages": [
             {"role": "user", "content": instruction}
         ]
     }
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
+        with _openrouter_slots:
+            response = get_http_session("openrouter").post(
+                url, headers=headers, json=payload, timeout=get_timeout("openrouter")
+            )
         response.raise_for_status()
     except requests.RequestException as e:
         return {"response_status": None, "response_text": f"Request error: {str(e)}"}
@@ -42,41 +62,166 @@ def call_llm(instruction: str) -> Dict[str, object]:
     try:
         data = response.json()
         content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
+        if use_cache and content:
+            get_llm_cache().set("openrouter", OPENROUTER_MODEL, instruction, content)
         return {"response_status": response.status_code, "response_text": content}
     except json.JSONDecodeError:
         return {"response_status": response.status_code, "response_text": "Error: Invalid JSON response"}
 
 
-def call_llm_gorq(instruction: str) -> str:
+def call_llm_gorq(instruction: str, use_cache: bool = True) -> str:
     """
     Sends a chat completion request to the Groq language model API.
 
     Args:
         instruction (str): The instruction to be sent to the language model.
+        use_cache (bool): Serve identical prompts from the response cache (default True).
 
     Returns:
         str: The cleaned response from the model.
     """
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = get_llm_cache().get("groq", GROQ_MODEL, instruction)
+        if cached is not None:
+            return cached
+
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         return "Error: GROQ_API_KEY not set"
     
-    client = Groq(api_key=api_key)
+    client = get_groq_client(api_key)
     
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": instruction}
-        ],
-        model="deepseek-r1-distill-llama-70b",
-    )
+    with _groq_slots:
+        chat_completion = client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": instruction}
+            ],
+            model=GROQ_MODEL,
+        )
     
     api_response = chat_completion.choices[0].message.content
     # Remove internal chain-of-thought markers if present
     clean_response = re.sub(r'<think>.*?</think>', '', api_response, flags=re.DOTALL).strip()
+    if use_cache and clean_response:
+        get_llm_cache().set("groq", GROQ_MODEL, instruction, clean_response)
     return clean_response
 
 
+class ThinkFilter:
+    """
+    Incrementally strips <think>...</think> blocks from streamed model output.
+
+    Text that might be the start of a tag is held back until the next chunk
+    shows whether it really is one.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        # Length of the longest suffix of text that is a proper prefix of tag
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+    def feed(self, text: str) -> str:
+        """Add a chunk of model output and return the part that is safe to show."""
+        self._buffer += text
+        visible = []
+        while True:
+            if self._inside:
+                end = self._buffer.find(self.CLOSE_TAG)
+                if end == -1:
+                    keep = self._partial_tag_length(self._buffer, self.CLOSE_TAG)
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                self._buffer = self._buffer[end + len(self.CLOSE_TAG):]
+                self._inside = False
+            else:
+                start = self._buffer.find(self.OPEN_TAG)
+                if start == -1:
+                    keep = self._partial_tag_length(self._buffer, self.OPEN_TAG)
+                    visible.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                visible.append(self._buffer[:start])
+                self._buffer = self._buffer[start + len(self.OPEN_TAG):]
+                self._inside = True
+        return "".join(visible)
+
+    def flush(self) -> str:
+        """Return any held-back text once the stream has ended."""
+        remaining = "" if self._inside else self._buffer
+        self._buffer = ""
+        return remaining
+
+
+def stream_llm_gorq(instruction: str, use_cache: bool = True) -> Iterator[str]:
+    """
+    Streams a chat completion from the Groq language model API.
+
+    Args:
+        instruction (str): The instruction to be sent to the language model.
+        use_cache (bool): Serve identical prompts from the response cache (default True).
+
+    Yields:
+        str: Pieces of the response as they arrive, with reasoning blocks removed.
+    """
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = get_llm_cache().get("groq", GROQ_MODEL, instruction)
+        if cached is not None:
+            yield cached
+            return
+
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        yield "Error: GROQ_API_KEY not set"
+        return
+
+    client = get_groq_client(api_key)
+    think_filter = ThinkFilter()
+    parts = []
+
+    with _groq_slots:
+        stream = client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": instruction}
+            ],
+            model=GROQ_MODEL,
+            stream=True,
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            text = think_filter.feed(delta)
+            if not parts:
+                # Match call_llm_gorq, which strips leading whitespace left behind by the reasoning block
+                text = text.lstrip()
+            if text:
+                parts.append(text)
+                yield text
+
+    tail = think_filter.flush()
+    if tail:
+        parts.append(tail)
+        yield tail
+
+    clean_response = "".join(parts).strip()
+    if use_cache and clean_response:
+        get_llm_cache().set("groq", GROQ_MODEL, instruction, clean_response)
+
+
 if __name__ == "__main__":
     # Example usage
     tweet = call_llm_gorq("Create a 100 word Funny Tweet.")
@@ -0,0 +1,193 @@
+import os
+import time
+import bisect
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from llm_integration import call_llm, call_llm_gorq
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, 64]
+
+
+def _openrouter_provider(instruction: str, use_cache: bool = True) -> str:
+    result = call_llm(instruction, use_cache=use_cache)
+    if result["response_status"] != 200:
+        raise RuntimeError(result["response_text"])
+    return result["response_text"].strip()
+
+
+def _stub_provider(instruction: str, use_cache: bool = True) -> str:
+    """Offline provider returning a deterministic answer after LLM_STUB_DELAY seconds."""
+    time.sleep(float(os.getenv("LLM_STUB_DELAY", 0)))
+    digest = hashlib.sha256(instruction.encode("utf-8")).hexdigest()[:12]
+    return f"Stub response {digest}"
+
+
+PROVIDERS = {
+    "groq": call_llm_gorq,
+    "openrouter": _openrouter_provider,
+    "stub": _stub_provider,
+}
+
+
+class LatencyHistogram:
+    """Bucketed latency counts plus a window of recent samples for percentile estimates."""
+
+    def __init__(self, window: int = 500):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.count += 1
+            if not ok:
+                self.errors += 1
+                return
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.samples.append(seconds)
+
+    def record_win(self) -> None:
+        with self._lock:
+            self.wins += 1
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            labels = [f"le_{bound}" for bound in LATENCY_BUCKETS] + ["le_inf"]
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "wins": self.wins,
+                "buckets": dict(zip(labels, self.buckets))
+            }
+
+
+class LLMRouter:
+    """
+    Sends each request to a primary provider and, if it has not answered within the
+    configured latency percentile of that provider, fires a hedged request to the
+    secondary. The first good answer wins; the other request is cancelled if it has
+    not started, or its result is discarded.
+    """
+
+    def __init__(self, providers: Dict[str, Callable], primary: str, secondary: Optional[str] = None,
+                 hedge_percentile: float = 0.95, default_hedge_delay: float = 20.0,
+                 min_samples: int = 20, max_workers: int = 16):
+        self.providers = providers
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.hedges = 0
+        self.histograms = {name: LatencyHistogram() for name in providers}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the primary before hedging."""
+        histogram = self.histograms[self.primary]
+        if len(histogram.samples) < self.min_samples:
+            return self.default_hedge_delay
+        return histogram.percentile(self.hedge_percentile)
+
+    def _call(self, name: str, instruction: str, use_cache: bool) -> str:
+        start = time.perf_counter()
+        try:
+            response = self.providers[name](instruction, use_cache=use_cache)
+            if not response or response.startswith(("Error:", "Request error:")):
+                raise RuntimeError(response or "Empty response")
+        except Exception:
+            self.histograms[name].record(time.perf_counter() - start, ok=False)
+            raise
+        self.histograms[name].record(time.perf_counter() - start, ok=True)
+        return response
+
+    def call(self, instruction: str, use_cache: bool = True) -> str:
+        """
+        Returns the first good response from the primary or the hedged secondary.
+
+        Raises:
+            RuntimeError: If every provider that was tried failed.
+        """
+        running = {self._executor.submit(self._call, self.primary, instruction, use_cache): self.primary}
+        done, _ = wait(running, timeout=self.hedge_delay() if self.secondary else None)
+
+        errors = []
+        hedged = False
+        while True:
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is None:
+                    self.histograms[name].record_win()
+                    for loser in running:
+                        loser.cancel()
+                    return future.result()
+                errors.append(f"{name}: {future.exception()}")
+                logger.warning("LLM provider %s failed: %s", name, future.exception())
+
+            # Hedge once: when the primary is slow, or immediately if it has already failed
+            if self.secondary and not hedged:
+                hedged = True
+                with self._lock:
+                    self.hedges += 1
+                running[self._executor.submit(self._call, self.secondary, instruction, use_cache)] = self.secondary
+
+            if not running:
+                raise RuntimeError("All LLM providers failed: " + "; ".join(errors))
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+    def stats(self) -> dict:
+        return {
+            "primary": self.primary,
+            "secondary": self.secondary,
+            "hedge_delay": self.hedge_delay() if self.secondary else None,
+            "hedges": self.hedges,
+            "providers": {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+        }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_llm_router() -> LLMRouter:
+    """Return the process-wide router configured from the LLM_* environment variables."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                secondary = os.getenv("LLM_SECONDARY_PROVIDER", "openrouter") or None
+                _router = LLMRouter(
+                    PROVIDERS,
+                    primary=os.getenv("LLM_PRIMARY_PROVIDER", "groq"),
+                    secondary=secondary if secondary != "none" else None,
+                    hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", 0.95)),
+                    default_hedge_delay=float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", 20))
+                )
+    return _router
+
+
+def route_llm(instruction: str, use_cache: bool = True) -> str:
+    """Send an instruction through the hedged provider router."""
+    return get_llm_router().call(instruction, use_cache=use_cache)
@@ -0,0 +1,108 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db, User, ApiKey, CacheVersion, current_generation_period, current_request_period
+
+logger = logging.getLogger(__name__)
+
+# db.create_all() only creates missing tables, so changes to existing tables are
+# applied here. Each migration runs once per database, in version order, and
+# must be safe on a database that create_all() just built with the change included.
+
+
+def _create_indexes(connection, names):
+    """Create the declared model indexes with the given names if they are missing."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(connection, checkfirst=True)
+
+
+def _add_columns(connection, columns):
+    """Add declared model columns that an existing table does not have yet."""
+    preparer = connection.dialect.identifier_preparer
+    for column in columns:
+        existing = {c['name'] for c in inspect(connection).get_columns(column.table.name)}
+        if column.name in existing:
+            continue
+        connection.execute(text(
+            f"ALTER TABLE {preparer.format_table(column.table)} "
+            f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=connection.dialect)}"
+        ))
+
+
+def _add_lookup_indexes(connection):
+    _create_indexes(connection, {
+        'ix_generation_user_timestamp',
+        'ix_generation_user_views',
+        'ix_generation_user_downloads',
+        'ix_generation_user_country',
+        'ix_user_stripe_customer_id',
+        'ix_api_key_user_id',
+        'ix_payment_history_user_date',
+    })
+    # Let the query planner see the new indexes' selectivity right away
+    connection.execute(text("ANALYZE"))
+
+
+def _add_usage_periods(connection):
+    _add_columns(connection, [User.__table__.c.generations_period, ApiKey.__table__.c.requests_period])
+    # Existing counters were kept current by the reset jobs, so they count the current period
+    user, api_key = User.__table__, ApiKey.__table__
+    connection.execute(user.update().where(user.c.generations_period.is_(None))
+                       .values(generations_period=current_generation_period()))
+    connection.execute(api_key.update().where(api_key.c.requests_period.is_(None))
+                       .values(requests_period=current_request_period()))
+
+
+def _add_cache_versions(connection):
+    CacheVersion.__table__.create(connection, checkfirst=True)
+    table = CacheVersion.__table__
+    if connection.execute(table.select().where(table.c.name == 'api_keys')).first() is None:
+        connection.execute(table.insert().values(name='api_keys', version=0))
+
+
+# (version, description, function taking a connection)
+MIGRATIONS = [
+    (1, "Indexes for per-user generation, API key and payment lookups and Stripe customer lookups",
+     _add_lookup_indexes),
+    (2, "Period stamps for monthly generation and daily API request counters", _add_usage_periods),
+    (3, "Shared version of the API key cache, for invalidation across processes", _add_cache_versions),
+]
+
+
+def _applied_versions(connection) -> set:
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations() -> list:
+    """
+    Apply pending schema migrations. Must run inside an app context.
+
+    Returns:
+        list: Versions applied by this call.
+    """
+    applied = []
+    with db.engine.begin() as connection:
+        done = _applied_versions(connection)
+
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        # One transaction per migration, so a failure leaves earlier ones recorded
+        with db.engine.begin() as connection:
+            migrate(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {"version": version, "description": description, "applied_at": datetime.utcnow()}
+            )
+        logger.info("Applied schema migration %d: %s", version, description)
+        applied.append(version)
+    return applied
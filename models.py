@@ -2,9 +2,28 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import json
 
 db = SQLAlchemy()
 
+# Monthly generation limits per subscription tier
+GENERATION_LIMITS = {
+    'free': 3,
+    'basic': 30,
+    'premium': float('inf')  # Unlimited
+}
+
+
+# Usage counters are stamped with the period they count. A counter whose stamp is
+# not the current period is stale and reads as zero; it is reset on the next write.
+def current_generation_period():
+    return datetime.utcnow().strftime('%Y-%m')
+
+
+def current_request_period():
+    return datetime.utcnow().strftime('%Y-%m-%d')
+
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -17,10 +36,11 @@ class User(UserMixin, db.Model):
     subscription_tier = db.Column(db.String(20), default='free')  # free, basic, premium
     subscription_status = db.Column(db.String(20), default='active')  # active, canceled, expired
     subscription_expiry = db.Column(db.DateTime, nullable=True)
-    stripe_customer_id = db.Column(db.String(100), nullable=True)
+    stripe_customer_id = db.Column(db.String(100), nullable=True, index=True)  # Stripe webhook lookups
     
     # Usage metrics
     monthly_generations = db.Column(db.Integer, default=0)
+    generations_period = db.Column(db.String(7), default=current_generation_period)  # YYYY-MM of monthly_generations
     total_generations = db.Column(db.Integer, default=0)
     last_generation_date = db.Column(db.DateTime, nullable=True)
     
@@ -34,22 +54,29 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def generations_this_month(self):
+        # Generations counted in the current month; a counter from an earlier month is stale
+        if self.generations_period != current_generation_period():
+            return 0
+        return self.monthly_generations or 0
+    
     def can_generate(self):
         # Check if user has reached their generation limit based on subscription tier
-        limits = {
-            'free': 3,
-            'basic': 30,
-            'premium': float('inf')  # Unlimited
-        }
-        return self.monthly_generations < limits.get(self.subscription_tier, 0)
+        return self.generations_this_month() < GENERATION_LIMITS.get(self.subscription_tier, 0)
+    
+    def remaining_generations(self):
+        # Number of generations left this month (inf for unlimited tiers)
+        return max(0, GENERATION_LIMITS.get(self.subscription_tier, 0) - self.generations_this_month())
     
     def increment_generation_count(self):
-        self.monthly_generations += 1
+        self.monthly_generations = self.generations_this_month() + 1
+        self.generations_period = current_generation_period()
         self.total_generations += 1
         self.last_generation_date = datetime.utcnow()
         
     def reset_monthly_generations(self):
         self.monthly_generations = 0
+        self.generations_period = current_generation_period()
         
 
 class Generation(db.Model):
@@ -69,11 +96,19 @@ class Generation(db.Model):
     is_public = db.Column(db.Boolean, default=False)  # Allow users to publish their generations
     download_count = db.Column(db.Integer, default=0)
     view_count = db.Column(db.Integer, default=0)
+    
+    # Every list, count and analytics query is scoped to one user, then sorted or grouped
+    __table_args__ = (
+        db.Index('ix_generation_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_generation_user_views', 'user_id', 'view_count'),
+        db.Index('ix_generation_user_downloads', 'user_id', 'download_count'),
+        db.Index('ix_generation_user_country', 'user_id', 'country'),
+    )
 
 
 class ApiKey(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     api_key = db.Column(db.String(64), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -82,15 +117,30 @@ class ApiKey(db.Model):
     
     # Usage tracking
     daily_requests = db.Column(db.Integer, default=0)
+    requests_period = db.Column(db.String(10), default=current_request_period)  # YYYY-MM-DD of daily_requests
     total_requests = db.Column(db.Integer, default=0)
     
+    def requests_today(self):
+        # Requests counted today; a counter from an earlier day is stale
+        if self.requests_period != current_request_period():
+            return 0
+        return self.daily_requests or 0
+    
     def increment_usage(self):
-        self.daily_requests += 1
+        self.daily_requests = self.requests_today() + 1
+        self.requests_period = current_request_period()
         self.total_requests += 1
         self.last_used = datetime.utcnow()
         
     def reset_daily_usage(self):
         self.daily_requests = 0
+        self.requests_period = current_request_period()
+
+
+class CacheVersion(db.Model):
+    # Shared version of a process-local cache; bumping it makes every process drop its entries
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
 
 class SubscriptionPlan(db.Model):
@@ -110,4 +160,51 @@ class PaymentHistory(db.Model):
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), nullable=False)  # succeeded, failed, pending
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
-    subscription_plan = db.Column(db.String(50), nullable=False)
\ No newline at end of file
+    subscription_plan = db.Column(db.String(50), nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_payment_history_user_date', 'user_id', 'payment_date'),
+    )
+
+class GenerationJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(36), unique=True, nullable=False)
+    batch_id = db.Column(db.String(36), db.ForeignKey('generation_batch.batch_id'), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    country = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), default='queued')  # queued, running, succeeded, failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Results
+    progress = db.Column(db.Text, default='{}')  # JSON: stage -> {"status": ..., "seconds": ...}
+    generation_id = db.Column(db.String(120), nullable=True)
+    file_paths = db.Column(db.Text, nullable=True)  # JSON string of saved output paths
+    error = db.Column(db.Text, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'country': self.country,
+            'status': self.status,
+            'progress': json.loads(self.progress or '{}'),
+            'generation_id': self.generation_id,
+            'file_paths': json.loads(self.file_paths) if self.file_paths else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class GenerationBatch(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='running')  # running, completed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    jobs = db.relationship('GenerationJob', backref='batch', lazy=True)
@@ -185,6 +185,18 @@ Example of a scene prompt:
 
 
 
+# Output layout requested from the scene-prompt model call. scene_parser.parse_scene_prompts
+# reads this layout locally, so keep the two in sync.
+SCENE_OUTPUT_FORMAT = """
+Output format (follow exactly, no other text):
+Scene 1: <short scene title>
+Image Prompt: <complete, self-contained image generation prompt on a single line>
+
+Scene 2: <short scene title>
+Image Prompt: <complete, self-contained image generation prompt on a single line>
+"""
+
+
 def get_image_prompt_dict(image_gen_prompts):
     
     prompt = f"""You are provided with a series of image generation scenes formatted 
@@ -0,0 +1,76 @@
+import os
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from groq import Groq
+
+load_dotenv()
+
+# Per-provider connection pool sizes and request timeouts (seconds)
+PROVIDER_SETTINGS = {
+    "groq": {
+        "pool_size": int(os.getenv("GROQ_POOL_SIZE", 10)),
+        "timeout": float(os.getenv("GROQ_TIMEOUT", 60)),
+    },
+    "openrouter": {
+        "pool_size": int(os.getenv("OPENROUTER_POOL_SIZE", 10)),
+        "timeout": float(os.getenv("OPENROUTER_TIMEOUT", 10)),
+    },
+    "voicerss": {
+        "pool_size": int(os.getenv("VOICE_RSS_POOL_SIZE", 10)),
+        "timeout": float(os.getenv("VOICE_RSS_TIMEOUT", 30)),
+    },
+}
+
+_lock = threading.Lock()
+_groq_clients = {}
+_sessions = {}
+
+
+def get_timeout(provider: str) -> float:
+    """Return the configured request timeout for a provider."""
+    return PROVIDER_SETTINGS[provider]["timeout"]
+
+
+def get_groq_client(api_key: str) -> Groq:
+    """
+    Return the process-wide Groq client for an API key.
+
+    The client keeps its HTTP connections alive between calls, so only the first
+    request of the process pays for the TCP and TLS handshake.
+    """
+    client = _groq_clients.get(api_key)
+    if client is None:
+        with _lock:
+            client = _groq_clients.get(api_key)
+            if client is None:
+                settings = PROVIDER_SETTINGS["groq"]
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=settings["pool_size"],
+                        max_keepalive_connections=settings["pool_size"]
+                    ),
+                    timeout=settings["timeout"]
+                )
+                client = Groq(api_key=api_key, http_client=http_client, timeout=settings["timeout"])
+                _groq_clients[api_key] = client
+    return client
+
+
+def get_http_session(provider: str) -> requests.Session:
+    """Return the process-wide pooled requests session for a provider ('openrouter' or 'voicerss')."""
+    session = _sessions.get(provider)
+    if session is None:
+        with _lock:
+            session = _sessions.get(provider)
+            if session is None:
+                pool_size = PROVIDER_SETTINGS[provider]["pool_size"]
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[provider] = session
+    return session
@@ -0,0 +1,118 @@
+from datetime import datetime
+
+from models import db, User, Generation, ApiKey, PaymentHistory
+
+# Queries of the dashboard, API and auth/subscription views. They return
+# unexecuted queries, so query_benchmark.py can check the plans of exactly what
+# the views run. Each is served by an index declared in models.py.
+
+
+def user_generations(user_id):
+    """All generations of a user, unordered."""
+    return Generation.query.filter_by(user_id=user_id)
+
+
+def recent_generations(user_id, limit=5):
+    return user_generations(user_id).order_by(Generation.timestamp.desc()).limit(limit)
+
+
+def generations_since(user_id, since):
+    """Generations of a user from since onwards; call .count() for the monthly usage."""
+    return Generation.query.filter(
+        Generation.user_id == user_id,
+        Generation.timestamp >= since
+    )
+
+
+def generation_listing(user_id, country='', date_from='', date_to=''):
+    """
+    The filtered generation list, newest first, ready to paginate.
+
+    Args:
+        country: Substring of the country name, case-insensitive.
+        date_from: First day to include, as YYYY-MM-DD; ignored if malformed.
+        date_to: Last day to include, as YYYY-MM-DD; ignored if malformed.
+    """
+    query = user_generations(user_id)
+
+    if country:
+        query = query.filter(Generation.country.ilike(f'%{country}%'))
+
+    if date_from:
+        try:
+            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d')
+            query = query.filter(Generation.timestamp >= date_from_obj)
+        except ValueError:
+            pass
+
+    if date_to:
+        try:
+            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d')
+            date_to_obj = date_to_obj.replace(hour=23, minute=59, second=59)
+            query = query.filter(Generation.timestamp <= date_to_obj)
+        except ValueError:
+            pass
+
+    return query.order_by(Generation.timestamp.desc())
+
+
+def user_generation(user_id, generation_id):
+    """One generation, only if it belongs to the user."""
+    return Generation.query.filter_by(generation_id=generation_id, user_id=user_id)
+
+
+def generations_by_date(user_id, start_date, end_date):
+    """(date, count) rows of a user's generations between two datetimes."""
+    return db.session.query(
+        db.func.date(Generation.timestamp).label('date'),
+        db.func.count().label('count')
+    ).filter(
+        Generation.user_id == user_id,
+        Generation.timestamp.between(start_date, end_date)
+    ).group_by(
+        db.func.date(Generation.timestamp)
+    )
+
+
+def generations_by_country(user_id, limit=10):
+    """(country, count) rows of a user's most generated countries."""
+    return db.session.query(
+        Generation.country,
+        db.func.count().label('count')
+    ).filter(
+        Generation.user_id == user_id
+    ).group_by(
+        Generation.country
+    ).order_by(
+        db.desc('count')
+    ).limit(limit)
+
+
+def most_viewed(user_id, limit=5):
+    return user_generations(user_id).order_by(Generation.view_count.desc()).limit(limit)
+
+
+def most_downloaded(user_id, limit=5):
+    return user_generations(user_id).order_by(Generation.download_count.desc()).limit(limit)
+
+
+def payment_history(user_id, limit=10):
+    return PaymentHistory.query.filter_by(user_id=user_id)\
+        .order_by(PaymentHistory.payment_date.desc())\
+        .limit(limit)
+
+
+def active_api_key_owner(api_key):
+    """(key id, user id, tier, status) of an active API key."""
+    return db.session.query(ApiKey.id, ApiKey.user_id, User.subscription_tier, User.subscription_status)\
+        .join(User, User.id == ApiKey.user_id)\
+        .filter(ApiKey.api_key == api_key, ApiKey.is_active == True)\
+        .limit(1)
+
+
+def user_api_keys(user_id):
+    return ApiKey.query.filter_by(user_id=user_id)
+
+
+def user_by_stripe_customer(stripe_customer_id):
+    return User.query.filter_by(stripe_customer_id=stripe_customer_id)
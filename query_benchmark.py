@@ -0,0 +1,221 @@
+"""
+Query-plan and latency regression check for the dashboard and API queries.
+
+Seeds a temporary SQLite database with generations spread over many users (one
+of them holding a large share, as an active premium account would), then for
+every query issued by dashboard.py, api.py and the Stripe/API key lookups (built
+with the same queries.py helpers the views call):
+
+  * asserts that EXPLAIN QUERY PLAN uses the expected index and never scans a table,
+  * asserts that the median latency over --repeat runs is under the query's budget.
+
+Usage:
+    python query_benchmark.py [--rows 1000000] [--users 1000] [--repeat 20] [--budget-scale 1.0]
+
+Exits with status 1 if any check fails.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Query
+
+from models import db, User, Generation, ApiKey, PaymentHistory
+from migrations import run_migrations
+import queries
+
+COUNTRIES = ["India", "Japan", "Nigeria", "Ireland", "Peru", "Norway", "Egypt", "Mexico",
+             "Vietnam", "Ghana", "Chile", "Iceland", "Turkey", "Kenya", "Brazil", "Greece"]
+HEAVY_USER_SHARE = 0.1
+BATCH_SIZE = 20000
+
+
+def create_benchmark_app(db_path: str) -> Flask:
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(rows: int, users: int) -> None:
+    """Insert users, API keys, payments and `rows` generations over the last two years."""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    db.session.execute(insert(User.__table__), [
+        {"id": i, "email": f"user{i}@example.com", "username": f"user{i}", "password_hash": "x",
+         "subscription_tier": "premium" if i == 1 else "free", "stripe_customer_id": f"cus_{i:08d}",
+         "monthly_generations": 0, "total_generations": 0}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(insert(ApiKey.__table__), [
+        {"user_id": i, "api_key": f"{i:064x}", "name": "default", "is_active": True,
+         "daily_requests": 0, "total_requests": 0}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(insert(PaymentHistory.__table__), [
+        {"user_id": rng.randint(1, users), "stripe_payment_id": f"pi_{i}", "amount": 9.99,
+         "status": "succeeded", "payment_date": now - timedelta(days=rng.randint(0, 730)),
+         "subscription_plan": "basic"}
+        for i in range(users * 12)
+    ])
+
+    heavy_rows = int(rows * HEAVY_USER_SHARE)
+    for start in range(0, rows, BATCH_SIZE):
+        batch = []
+        for i in range(start, min(start + BATCH_SIZE, rows)):
+            user_id = 1 if i < heavy_rows else rng.randint(2, users)
+            timestamp = now - timedelta(seconds=rng.randint(0, 730 * 24 * 3600))
+            country = rng.choice(COUNTRIES)
+            batch.append({
+                "generation_id": f"{country}_{timestamp:%Y%m%d%H%M%S}_{i}", "user_id": user_id,
+                "country": country, "timestamp": timestamp, "is_public": False,
+                "view_count": rng.randint(0, 500), "download_count": rng.randint(0, 100)
+            })
+        db.session.execute(insert(Generation.__table__), batch)
+    db.session.commit()
+
+
+def count_of(query: Query):
+    """The statement Query.count() runs for query, as paginate() does for its total."""
+    return select(db.func.count()).select_from(query.order_by(None).subquery())
+
+
+def page_of(query: Query, page: int, per_page: int) -> Query:
+    """The items query paginate() runs for one page."""
+    return query.limit(per_page).offset((page - 1) * per_page)
+
+
+def build_queries(user_id: int, generation_id: str):
+    """
+    The queries of the views, built with the same queries.py helpers the views call.
+
+    The expected index is a name prefix: count-only queries may be answered from
+    any covering per-user index, so they accept every ix_generation_user_* index.
+
+    Returns:
+        list: (name, query or statement, expected index prefix, budget in ms) tuples.
+    """
+    now = datetime.utcnow()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    date_from = (now - timedelta(days=90)).strftime('%Y-%m-%d')
+    date_to = now.strftime('%Y-%m-%d')
+    per_page = 10
+
+    listing = queries.generation_listing(user_id)
+    filtered = queries.generation_listing(user_id, 'an', date_from, date_to)
+
+    return [
+        # dashboard.index, api get_usage
+        ("recent generations", queries.recent_generations(user_id), "ix_generation_user_timestamp", 10),
+        ("generations this month", count_of(queries.generations_since(user_id, month_start)),
+         "ix_generation_user_timestamp", 20),
+        # dashboard.generations, api list_generations
+        ("generation list count", count_of(listing), "ix_generation_user_", 50),
+        ("generation list page 1", page_of(listing, 1, per_page), "ix_generation_user_timestamp", 10),
+        ("generation list page 50", page_of(listing, 50, per_page), "ix_generation_user_timestamp", 20),
+        ("filtered list count", count_of(filtered), "ix_generation_user_", 30),
+        ("filtered list page 1", page_of(filtered, 1, per_page), "ix_generation_user_timestamp", 20),
+        # dashboard.view_generation / download_file, api get_generation / download_file
+        ("generation by id", queries.user_generation(user_id, generation_id), "sqlite_autoindex_generation", 5),
+        # dashboard.analytics
+        ("analytics by date", queries.generations_by_date(user_id, now - timedelta(days=30), now),
+         "ix_generation_user_timestamp", 30),
+        ("analytics by country", queries.generations_by_country(user_id), "ix_generation_user_country", 150),
+        ("most viewed", queries.most_viewed(user_id), "ix_generation_user_views", 10),
+        ("most downloaded", queries.most_downloaded(user_id), "ix_generation_user_downloads", 10),
+        # dashboard.subscription
+        ("payment history", queries.payment_history(user_id), "ix_payment_history_user_date", 5),
+        # api_key_cache.resolve_api_key, auth.api_keys_list, subscription webhooks
+        ("api key lookup", queries.active_api_key_owner(f"{user_id:064x}"), "sqlite_autoindex_api_key", 5),
+        ("api keys of user", queries.user_api_keys(user_id), "ix_api_key_user_id", 5),
+        ("user by stripe customer", queries.user_by_stripe_customer(f"cus_{user_id:08d}").limit(1),
+         "ix_user_stripe_customer_id", 5),
+    ]
+
+
+def _statement(query):
+    return query.statement if isinstance(query, Query) else query
+
+
+def explain(query) -> list:
+    sql = str(_statement(query).compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in db.session.execute(db.text("EXPLAIN QUERY PLAN " + sql))]
+
+
+def check_plan(plan: list, expected_index: str) -> list:
+    """Return the problems found in a query plan."""
+    problems = []
+    if not any(f"INDEX {expected_index}" in step for step in plan):
+        problems.append(f"does not use {expected_index}*")
+    for step in plan:
+        # "SCAN <table>" without an index is a full table scan
+        if step.startswith("SCAN ") and " INDEX " not in step:
+            problems.append(f"full scan: {step}")
+    return problems
+
+
+def time_query(query, repeat: int) -> float:
+    """Median execution time in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.session.execute(_statement(query)).all()
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.expunge_all()
+    return statistics.median(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000, help="Generations to seed.")
+    parser.add_argument("--users", type=int, default=1000, help="Users to spread them over.")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per query for the latency median.")
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="Multiply every latency budget, for slow machines.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_benchmark_app(os.path.join(tmp, "benchmark.db"))
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            seed(args.rows, args.users)
+            # Apply the migrations to the seeded data, as on an existing deployment
+            run_migrations()
+            print(f"Seeded {args.rows} generations for {args.users} users in {time.perf_counter() - start:.1f}s\n")
+
+            # The heavy user is the worst case for every per-user query
+            generation_id = db.session.query(Generation.generation_id).filter_by(user_id=1).limit(1).scalar()
+            checks = build_queries(1, generation_id)
+            failures = 0
+            for name, query, expected_index, budget in checks:
+                plan = explain(query)
+                median_ms = time_query(query, args.repeat)
+                problems = check_plan(plan, expected_index)
+                budget *= args.budget_scale
+                if median_ms > budget:
+                    problems.append(f"median {median_ms:.2f}ms over budget {budget:.0f}ms")
+
+                status = "FAIL" if problems else "ok"
+                print(f"[{status:>4}] {name:<26} {median_ms:8.2f}ms (budget {budget:.0f}ms)")
+                for step in plan:
+                    print(f"         {step}")
+                for problem in problems:
+                    print(f"         -> {problem}")
+                failures += bool(problems)
+
+    print(f"\n{failures} of {len(checks)} queries failed" if failures
+          else "\nAll query plans and latencies are within budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
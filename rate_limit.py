@@ -0,0 +1,227 @@
+import time
+import atexit
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, func, select, update
+
+from models import db, ApiKey, current_request_period
+
+logger = logging.getLogger(__name__)
+
+# Per-tier API limits: requests per UTC day, and a token bucket refilled at
+# per_second that allows bursts of up to burst requests
+API_RATE_LIMITS = {
+    'free': {'daily': 10, 'per_second': 1, 'burst': 5},
+    'basic': {'daily': 100, 'per_second': 5, 'burst': 20},
+    'premium': {'daily': 1000, 'per_second': 20, 'burst': 50}
+}
+
+RateLimitResult = namedtuple('RateLimitResult', 'allowed reason limit remaining reset retry_after')
+
+
+def _next_day_epoch() -> int:
+    tomorrow = datetime.utcnow().date() + timedelta(days=1)
+    return int((datetime(tomorrow.year, tomorrow.month, tomorrow.day) - datetime(1970, 1, 1)).total_seconds())
+
+
+class RateLimiter:
+    """
+    Per-API-key token bucket and daily quota, held in process memory.
+
+    Accepted requests are only counted in memory; flush() persists them to
+    ApiKey.daily_requests / total_requests / last_used in one bulk UPDATE and reads
+    the stored daily counts back, so usage recorded by other processes is picked
+    up at every flush. Other processes can therefore exceed a daily quota by at
+    most what they accept within one flush interval.
+    """
+
+    def __init__(self, limits: dict = API_RATE_LIMITS):
+        self.limits = limits
+        self._buckets = {}  # key id -> [tokens, monotonic time of last refill]
+        self._usage = {}  # key id -> {"period", "synced", "local"}: daily count is synced + local
+        self._pending = {}  # (key id, period) -> [requests, last used]
+        # An untouched bucket is full again after this long, whatever the tier
+        self._refill_seconds = max(tier['burst'] / tier['per_second'] for tier in limits.values())
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.failures = 0
+        self.pruned = 0
+
+    def check(self, key_id: int, tier: str, load_usage) -> RateLimitResult:
+        """
+        Count a request against a key's burst and daily limits.
+
+        Args:
+            key_id: ApiKey primary key.
+            tier: Subscription tier of the key's owner.
+            load_usage: Callable returning the key's stored request count for today;
+                called only the first time the key is seen in a period.
+
+        Returns:
+            RateLimitResult: Whether the request is allowed, plus the values for the
+                X-RateLimit-* and Retry-After headers.
+        """
+        limits = self.limits.get(tier)
+        reset = _next_day_epoch()
+        if limits is None:
+            return RateLimitResult(False, 'daily', 0, 0, reset, max(1, reset - int(time.time())))
+
+        period = current_request_period()
+        with self._lock:
+            usage = self._usage.get(key_id)
+            if usage is None or usage["period"] != period:
+                usage = None
+
+        if usage is None:
+            # Outside the lock: this may hit the database
+            stored = load_usage()
+            with self._lock:
+                usage = self._usage.get(key_id)
+                if usage is None or usage["period"] != period:
+                    usage = self._usage[key_id] = {"period": period, "synced": stored, "local": 0}
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key_id, (limits['burst'], now))
+            tokens = min(limits['burst'], tokens + (now - updated) * limits['per_second'])
+            used = usage["synced"] + usage["local"]
+
+            if used >= limits['daily']:
+                self._buckets[key_id] = [tokens, now]
+                self.rejected += 1
+                return RateLimitResult(False, 'daily', limits['daily'], 0, reset, max(1, reset - int(time.time())))
+            if tokens < 1:
+                self._buckets[key_id] = [tokens, now]
+                self.rejected += 1
+                retry_after = (1 - tokens) / limits['per_second']
+                return RateLimitResult(False, 'burst', limits['daily'], limits['daily'] - used, reset,
+                                       max(1, int(retry_after + 0.999)))
+
+            self._buckets[key_id] = [tokens - 1, now]
+            usage["local"] += 1
+            pending = self._pending.setdefault((key_id, period), [0, None])
+            pending[0] += 1
+            pending[1] = datetime.utcnow()
+            self.allowed += 1
+            return RateLimitResult(True, None, limits['daily'], limits['daily'] - used - 1, reset, None)
+
+    def _prune(self) -> None:
+        """Forget keys that hold no state worth keeping, so memory does not grow with every key ever seen."""
+        period = current_request_period()
+        idle_before = time.monotonic() - self._refill_seconds
+        stale_usage = [key_id for key_id, usage in self._usage.items() if usage["period"] != period]
+        for key_id in stale_usage:
+            del self._usage[key_id]
+        # A bucket idle long enough to have refilled completely is the same as no bucket
+        idle_buckets = [key_id for key_id, (_, updated) in self._buckets.items() if updated < idle_before]
+        for key_id in idle_buckets:
+            del self._buckets[key_id]
+        self.pruned += len(stale_usage) + len(idle_buckets)
+
+    def flush(self) -> int:
+        """
+        Persist pending usage, refresh the daily counts and prune idle keys.
+        Must run inside an app context.
+
+        Returns:
+            int: Number of keys written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                # Usage of earlier periods is already in _pending, which is written below
+                self._prune()
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            table = ApiKey.__table__
+            rows = [{"pk": key_id, "period": period, "delta": delta, "used_at": used_at}
+                    for (key_id, period), (delta, used_at) in pending.items()]
+            # Usage of a day that another process already rolled past only adds to the totals
+            newer = table.c.requests_period > bindparam("period")
+            statement = (update(table)
+                         .where(table.c.id == bindparam("pk"))
+                         .values(daily_requests=case(
+                                     (table.c.requests_period == bindparam("period"),
+                                      func.coalesce(table.c.daily_requests, 0) + bindparam("delta")),
+                                     (newer, table.c.daily_requests),
+                                     else_=bindparam("delta")),
+                                 requests_period=case((newer, table.c.requests_period), else_=bindparam("period")),
+                                 total_requests=func.coalesce(table.c.total_requests, 0) + bindparam("delta"),
+                                 last_used=bindparam("used_at")))
+            try:
+                db.session.execute(statement, rows)
+                # Read back in the same transaction, so the counts match exactly what was committed
+                stored = db.session.execute(
+                    select(table.c.id, table.c.daily_requests, table.c.requests_period)
+                    .where(table.c.id.in_({key_id for key_id, _ in pending}))
+                ).all()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    for key, (delta, used_at) in pending.items():
+                        current = self._pending.setdefault(key, [0, used_at])
+                        current[0] += delta
+                    self.failures += 1
+                logger.exception("Failed to persist API usage of %d keys", len(pending))
+                return 0
+
+            with self._lock:
+                for key_id, daily_requests, period in stored:
+                    usage = self._usage.get(key_id)
+                    if usage is None or usage["period"] != period:
+                        continue
+                    # The stored count now includes what was flushed, and whatever other processes flushed
+                    usage["local"] -= pending.get((key_id, period), (0,))[0]
+                    usage["synced"] = daily_requests or 0
+                self.flushes += 1
+            return len(pending)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "allowed": self.allowed,
+                "rejected": self.rejected,
+                "tracked_keys": len(self._usage),
+                "buckets": len(self._buckets),
+                "pruned": self.pruned,
+                "pending_keys": len(self._pending),
+                "pending_requests": sum(delta for delta, _ in self._pending.values()),
+                "flushes": self.flushes,
+                "failures": self.failures
+            }
+
+
+_limiter = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _limiter
+
+
+def rate_limit_headers(response, result: RateLimitResult):
+    """Add the X-RateLimit-* headers (and Retry-After on rejection) to a response."""
+    response.headers['X-RateLimit-Limit'] = str(result.limit)
+    response.headers['X-RateLimit-Remaining'] = str(max(0, result.remaining))
+    response.headers['X-RateLimit-Reset'] = str(result.reset)
+    if result.retry_after is not None:
+        response.headers['Retry-After'] = str(result.retry_after)
+    return response
+
+
+def init_rate_limiter(app, scheduler) -> None:
+    """Persist API usage every RATE_LIMIT_FLUSH_SECONDS and once more at shutdown."""
+    def flush():
+        with app.app_context():
+            _limiter.flush()
+
+    scheduler.add_job(flush, 'interval', seconds=app.config['RATE_LIMIT_FLUSH_SECONDS'],
+                      id='flush_api_usage', replace_existing=True, max_instances=1, coalesce=True)
+    atexit.register(flush)
@@ -0,0 +1,131 @@
+import os
+import time
+import gzip
+import shutil
+import logging
+import threading
+
+from artifacts import BUNDLE_NAME
+from durability import fsync_file, sync_later
+from storage import COLD_SUFFIXES, ETAG_SUFFIX, iter_generation_dirs, zstandard
+
+logger = logging.getLogger(__name__)
+
+_last_run_lock = threading.Lock()
+_last_run = None
+
+
+def _compress_file(path: str, codec: str) -> str:
+    """Write a compressed copy of path next to it and return the new path."""
+    suffix = ".zst" if codec == "zstd" else ".gz"
+    target = path + suffix
+    tmp_path = target + ".tmp"
+    with open(path, "rb") as src:
+        if codec == "zstd":
+            with open(tmp_path, "wb") as dst:
+                zstandard.ZstdCompressor(level=19).copy_stream(src, dst)
+        else:
+            with gzip.open(tmp_path, "wb", compresslevel=9) as dst:
+                shutil.copyfileobj(src, dst)
+    fsync_file(tmp_path)
+    os.replace(tmp_path, target)
+    return target
+
+
+def compress_generation(gen_dir: str, codec: str, min_saving: float = 0.05) -> dict:
+    """
+    Move the artifacts of one generation directory into the cold tier.
+
+    Files are compressed next to the original, which is removed once the
+    compressed copy is in place. Files that do not shrink by at least min_saving
+    (typically the MP3) are left as they are. The precomputed zip bundle is
+    dropped; downloads fall back to streaming it.
+
+    Returns:
+        dict: bytes_before, bytes_after and files compressed.
+    """
+    report = {"bytes_before": 0, "bytes_after": 0, "files": 0}
+    compressed = []
+    for name in sorted(os.listdir(gen_dir)):
+        path = os.path.join(gen_dir, name)
+        # ETag sidecars stay as they are: they hash the uncompressed content
+        if not os.path.isfile(path) or name.endswith(tuple(COLD_SUFFIXES) + (".tmp", ETAG_SUFFIX)):
+            continue
+        size = os.path.getsize(path)
+        report["bytes_before"] += size
+
+        if name == BUNDLE_NAME:
+            os.remove(path)
+            if os.path.exists(path + ETAG_SUFFIX):
+                os.remove(path + ETAG_SUFFIX)
+            continue
+
+        target = _compress_file(path, codec)
+        target_size = os.path.getsize(target)
+        if target_size > size * (1 - min_saving):
+            os.remove(target)
+            report["bytes_after"] += size
+            continue
+
+        os.remove(path)
+        compressed.append(target)
+        report["bytes_after"] += target_size
+        report["files"] += 1
+
+    sync_later(compressed)
+    return report
+
+
+def _is_cold(gen_dir: str) -> bool:
+    return any(name.endswith(tuple(COLD_SUFFIXES)) for name in os.listdir(gen_dir))
+
+
+def run_retention(output_dir: str, max_age_days: float, codec: str = "zstd") -> dict:
+    """
+    Compress every generation older than max_age_days into the cold tier.
+
+    Age is taken from the newest file of the generation directory, so a
+    generation that was rewritten recently stays hot.
+
+    Returns:
+        dict: Summary of the run, including the bytes reclaimed.
+    """
+    global _last_run
+    if codec == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed, compressing cold generations with gzip")
+        codec = "gzip"
+
+    start = time.perf_counter()
+    cutoff = time.time() - max_age_days * 24 * 3600
+    report = {"generations": 0, "files": 0, "bytes_before": 0, "bytes_after": 0, "errors": 0}
+    for generation_id, gen_dir in iter_generation_dirs(output_dir):
+        try:
+            # A sidecar written when an old file was first downloaded does not make the generation new
+            mtimes = [entry.stat().st_mtime for entry in os.scandir(gen_dir)
+                      if entry.is_file() and not entry.name.endswith(ETAG_SUFFIX)]
+            if not mtimes or max(mtimes) > cutoff or _is_cold(gen_dir):
+                continue
+            result = compress_generation(gen_dir, codec)
+        except Exception:
+            report["errors"] += 1
+            logger.exception("Failed to move generation %s to the cold tier", generation_id)
+            continue
+        report["generations"] += 1
+        for field in ("files", "bytes_before", "bytes_after"):
+            report[field] += result[field]
+
+    report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+    report["codec"] = codec
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    report["finished_at"] = time.time()
+    with _last_run_lock:
+        _last_run = report
+    logger.info("Retention moved %d generations to the cold tier, reclaimed %d bytes",
+                report["generations"], report["bytes_reclaimed"])
+    return report
+
+
+def get_retention_stats() -> dict:
+    """Report of the last retention run in this process, or None."""
+    with _last_run_lock:
+        return dict(_last_run) if _last_run else None
@@ -0,0 +1,121 @@
+import re
+import ast
+import logging
+import threading
+from typing import Dict, Optional
+
+from llm_router import route_llm
+from prompts import get_image_prompt_dict
+
+logger = logging.getLogger(__name__)
+
+# "Scene 3: Title", "**Scene 3 - Title**", "### 3. Title", "3) Title"
+_SCENE_HEADER = re.compile(
+    r"^[\s#>*_-]*(?:Scene\s+(\d+)|(\d+)\s*[.)])[\s*_]*[:.\-–—]?[\s*_]*(.*)$",
+    re.IGNORECASE | re.MULTILINE
+)
+# "Image Prompt: ...", "- **Image Prompt:** ...", "Prompt - ..."
+_PROMPT_LABEL = re.compile(
+    r"^[\s>*_-]*(?:Image\s+)?Prompt[\s*_]*[:\-–—][\s*_]*",
+    re.IGNORECASE | re.MULTILINE
+)
+# Any other "Label:" line that ends an image prompt block
+_OTHER_LABEL = re.compile(r"^[\s>*_-]*\**[A-Z][\w /]{0,30}\**\s*:", re.MULTILINE)
+
+_stats_lock = threading.Lock()
+_stats = {"parsed": 0, "fallback": 0, "failed": 0}
+
+
+def _clean(text: str) -> str:
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip('*_" ').strip()
+
+
+def parse_scene_prompts(scene_text: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """
+    Parse a numbered scene list into {"Scene N": {"Prompt": text}} without calling a model.
+
+    Understands the layout requested by prompts.SCENE_OUTPUT_FORMAT as well as the
+    common markdown variations of it. Returns None when no scene could be read, or
+    when a scene number repeats, since the layout was then not understood:
+
+    >>> parse_scene_prompts("Scene 1: Dawn\\nImage Prompt: A misty village\\n"
+    ...                     "Scene 2: Dusk\\nImage Prompt: A red sky")
+    {'Scene 1': {'Prompt': 'A misty village'}, 'Scene 2': {'Prompt': 'A red sky'}}
+    >>> parse_scene_prompts("Scene 1: Dawn\\nImage Prompt: A misty village\\n"
+    ...                     "Scene 1: Dusk\\nImage Prompt: A red sky") is None
+    True
+    """
+    headers = list(_SCENE_HEADER.finditer(scene_text or ""))
+    if not headers:
+        return None
+
+    scenes = {}
+    for index, header in enumerate(headers):
+        number = header.group(1) or header.group(2)
+        end = headers[index + 1].start() if index + 1 < len(headers) else len(scene_text)
+        body = scene_text[header.end():end]
+
+        label = _PROMPT_LABEL.search(body)
+        if label:
+            prompt = body[label.end():]
+            next_label = _OTHER_LABEL.search(prompt)
+            if next_label and next_label.start() > 0:
+                prompt = prompt[:next_label.start()]
+        else:
+            # No explicit label: the whole scene description is the prompt
+            prompt = header.group(3) + "\n" + body
+
+        prompt = _clean(prompt)
+        if not prompt or f"Scene {number}" in scenes:
+            return None
+        scenes[f"Scene {number}"] = {"Prompt": prompt}
+
+    return scenes
+
+
+def _convert_with_llm(scene_text: str) -> Dict[str, Dict[str, str]]:
+    conversion = route_llm(get_image_prompt_dict(scene_text)).strip()
+    # Remove the code fence the model tends to wrap its answer in
+    conversion = conversion.removeprefix("```python").removesuffix("```")
+    scene_dict = ast.literal_eval(conversion.strip())
+    if not isinstance(scene_dict, dict):
+        raise ValueError("LLM did not return a dictionary")
+    return scene_dict
+
+
+def get_scene_dict(scene_text: str) -> Dict[str, Dict[str, str]]:
+    """
+    Convert scene prompts text to a scene dictionary.
+
+    The text is parsed locally; the LLM conversion is only used when parsing fails.
+
+    Raises:
+        ValueError: If neither the parser nor the LLM produced a dictionary.
+    """
+    scene_dict = parse_scene_prompts(scene_text)
+    if scene_dict:
+        with _stats_lock:
+            _stats["parsed"] += 1
+        return scene_dict
+
+    logger.warning("Local scene parsing failed, falling back to LLM conversion")
+    try:
+        scene_dict = _convert_with_llm(scene_text)
+    except Exception as e:
+        with _stats_lock:
+            _stats["failed"] += 1
+        raise ValueError("Failed to convert scene prompts to dictionary: " + str(e))
+
+    with _stats_lock:
+        _stats["fallback"] += 1
+    return scene_dict
+
+
+def get_scene_parser_stats() -> dict:
+    """Return parse/fallback counters and the share of conversions that needed the LLM."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["parsed"] + stats["fallback"] + stats["failed"]
+    stats["fallback_rate"] = (stats["fallback"] + stats["failed"]) / total if total else 0.0
+    return stats
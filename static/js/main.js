@@ -151,6 +151,12 @@ document.addEventListener('DOMContentLoaded', function() {
                 country: countryInput.value.trim()
             };
             
+            // Stream the story and voiceover as they are written when the browser supports it
+            if (window.EventSource) {
+                streamGeneration(data.country, resultContainer, loadingSpinner, submitButton);
+                return;
+            }
+            
             // Make API request
             fetch('/generate', {
                 method: 'POST',
@@ -177,17 +183,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     document.getElementById('scenes-preview').textContent = data.preview.scenes_preview;
                     
                     // Update download links
-                    const downloadContainer = document.getElementById('download-container');
-                    if (downloadContainer) {
-                        downloadContainer.classList.remove('d-none');
-                        
-                        // Update download links with the correct paths
-                        document.getElementById('download-story').href = data.paths.story_path;
-                        document.getElementById('download-voiceover').href = data.paths.voiceover_path;
-                        document.getElementById('download-audio').href = data.paths.voiceover_tts_path;
-                        document.getElementById('download-scenes').href = data.paths.scenes_path;
-                        document.getElementById('view-generation').href = '/view/' + data.generation_id;
-                    }
+                    updateDownloadLinks(data);
                 }
                 
                 // Re-enable form
@@ -229,6 +225,74 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeCharts();
 });
 
+// Update download links with the paths of a finished generation
+function updateDownloadLinks(data) {
+    const downloadContainer = document.getElementById('download-container');
+    if (downloadContainer) {
+        downloadContainer.classList.remove('d-none');
+        
+        document.getElementById('download-story').href = data.paths.story_path;
+        document.getElementById('download-voiceover').href = data.paths.voiceover_path;
+        document.getElementById('download-audio').href = data.paths.voiceover_tts_path;
+        document.getElementById('download-scenes').href = data.paths.scenes_path;
+        document.getElementById('view-generation').href = '/view/' + data.generation_id;
+    }
+}
+
+// Generate content over Server-Sent Events, showing story and voiceover tokens as they arrive
+function streamGeneration(country, resultContainer, loadingSpinner, submitButton) {
+    const storyPreview = document.getElementById('story-preview');
+    const voiceoverPreview = document.getElementById('voiceover-preview');
+    const scenesPreview = document.getElementById('scenes-preview');
+    let started = false;
+    
+    storyPreview.textContent = '';
+    voiceoverPreview.textContent = '';
+    scenesPreview.textContent = 'Generating scene descriptions...';
+    
+    const source = new EventSource('/generate/stream?country=' + encodeURIComponent(country));
+    
+    function showResults() {
+        if (!started) {
+            started = true;
+            loadingSpinner.classList.add('d-none');
+            resultContainer.classList.remove('d-none');
+        }
+    }
+    
+    function finish() {
+        source.close();
+        loadingSpinner.classList.add('d-none');
+        submitButton.disabled = false;
+    }
+    
+    source.addEventListener('story', function(e) {
+        showResults();
+        storyPreview.textContent += JSON.parse(e.data).token;
+    });
+    
+    source.addEventListener('voiceover', function(e) {
+        showResults();
+        voiceoverPreview.textContent += JSON.parse(e.data).token;
+    });
+    
+    source.addEventListener('scenes', function(e) {
+        scenesPreview.textContent = JSON.parse(e.data).text;
+    });
+    
+    source.addEventListener('done', function(e) {
+        updateDownloadLinks(JSON.parse(e.data));
+        finish();
+    });
+    
+    source.addEventListener('error', function(e) {
+        // Server-sent error events carry data; connection failures do not
+        const message = e.data ? JSON.parse(e.data).error : 'Connection lost while generating.';
+        alert('Error: ' + message);
+        finish();
+    });
+}
+
 // Function to initialize charts (if present)
 function initializeCharts() {
     // Monthly generations chart
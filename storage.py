@@ -0,0 +1,365 @@
+import io
+import os
+import re
+import gzip
+import shutil
+import hashlib
+import logging
+from typing import Iterator, Optional, Tuple
+
+from flask import current_app, redirect, send_file
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+try:
+    import zstandard
+except ImportError:  # Optional: gzip is used for the cold tier without it
+    zstandard = None
+
+# Suffixes of artifacts compressed into the cold tier, in lookup order
+COLD_SUFFIXES = {".zst": "zstd", ".gz": "gzip"}
+# Sidecar holding the content hash of a generated file (<name>.etag), written at save time
+ETAG_SUFFIX = ".etag"
+
+
+# Generation directories are sharded as <root>/<YYYY>/<MM>/<hash prefix>/<generation_id>.
+# The date comes from the generation_id's timestamp suffix, the prefix from its SHA-1.
+_GENERATION_DATE = re.compile(r"_(\d{4})(\d{2})\d{8}$")
+_SHARD_YEAR = re.compile(r"^\d{4}$")
+UNDATED_SHARD = "undated"
+
+
+def shard_path(generation_id: str) -> str:
+    """Path of a generation directory relative to the output root."""
+    match = _GENERATION_DATE.search(generation_id)
+    year, month = match.groups() if match else (UNDATED_SHARD, "00")
+    prefix = hashlib.sha1(generation_id.encode("utf-8")).hexdigest()[:2]
+    return os.path.join(year, month, prefix, generation_id)
+
+
+def resolve_generation_dir(root: str, generation_id: str) -> str:
+    """
+    Directory of a generation under root.
+
+    Generations not yet moved by the layout migration are still found in the
+    flat <root>/<generation_id> directory; new generations go to the sharded path.
+    """
+    sharded = os.path.join(root, shard_path(generation_id))
+    if not os.path.isdir(sharded):
+        flat = os.path.join(root, generation_id)
+        if os.path.isdir(flat):
+            return flat
+    return sharded
+
+
+def _is_shard(name: str) -> bool:
+    return bool(_SHARD_YEAR.match(name)) or name == UNDATED_SHARD
+
+
+def iter_flat_generation_dirs(root: str) -> Iterator[Tuple[str, str]]:
+    """Yield (generation_id, path) of generations still in the flat layout."""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir() and not entry.name.startswith(".") and not _is_shard(entry.name):
+                yield entry.name, entry.path
+
+
+def iter_generation_dirs(root: str) -> Iterator[Tuple[str, str]]:
+    """Yield (generation_id, path) of every generation under root, sharded or flat."""
+    yield from iter_flat_generation_dirs(root)
+    with os.scandir(root) as years:
+        shards = sorted(entry.path for entry in years if entry.is_dir() and _is_shard(entry.name))
+    for year in shards:
+        for month in sorted(os.scandir(year), key=lambda entry: entry.name):
+            if not month.is_dir():
+                continue
+            for prefix in os.scandir(month.path):
+                if not prefix.is_dir():
+                    continue
+                for entry in os.scandir(prefix.path):
+                    if entry.is_dir():
+                        yield entry.name, entry.path
+
+
+def migrate_to_sharded(root: str, limit: Optional[int] = None) -> int:
+    """
+    Move flat generation directories to the sharded layout.
+
+    Each move is a single rename, so readers see the generation in one place or
+    the other, and the resolver checks both. The migration can be interrupted
+    and rerun at any time; it only picks up directories that are still flat.
+
+    Returns:
+        int: Number of generations moved.
+    """
+    moved = 0
+    for generation_id, flat in iter_flat_generation_dirs(root):
+        if limit is not None and moved >= limit:
+            break
+        target = os.path.join(root, shard_path(generation_id))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.rename(flat, target)
+        except OSError:
+            if not os.path.isdir(target):
+                raise
+            # Both exist (files were written to the flat path meanwhile): merge, keeping the sharded copy
+            for name in os.listdir(flat):
+                if not os.path.exists(os.path.join(target, name)):
+                    os.replace(os.path.join(flat, name), os.path.join(target, name))
+            shutil.rmtree(flat, ignore_errors=True)
+        moved += 1
+        if moved % 1000 == 0:
+            logger.info("Moved %d generations to the sharded layout", moved)
+    return moved
+
+
+def open_cold(path: str):
+    """Open a cold-tier file as a binary stream of the decompressed artifact."""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} requires the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return gzip.open(path, "rb")
+
+
+def _logical_path(path: str) -> str:
+    """Path of the artifact a cold-tier file holds, i.e. without its compression suffix."""
+    for suffix in COLD_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def write_etag(path: str) -> str:
+    """
+    Hash the (decompressed) content of a generated file into its ETag sidecar.
+
+    Returns:
+        str: The ETag.
+    """
+    digest = hashlib.sha256()
+    with (open_cold(path) if path != _logical_path(path) else open(path, "rb")) as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    etag = digest.hexdigest()[:32]
+
+    sidecar = _logical_path(path) + ETAG_SUFFIX
+    tmp_path = sidecar + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(etag)
+    os.replace(tmp_path, sidecar)
+    return etag
+
+
+def file_etag(path: str) -> str:
+    """
+    Strong ETag for a generated file, derived from its content.
+
+    It is read from the sidecar written at save time, so it survives moves to the
+    sharded layout and the cold tier. Files saved before sidecars existed are
+    hashed on first request.
+    """
+    try:
+        with open(_logical_path(path) + ETAG_SUFFIX) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return write_etag(path)
+
+
+def cache_privately(response):
+    """Mark a generated output as cacheable by the browser for OUTPUT_CACHE_MAX_AGE, but not by shared caches."""
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+def send_generated_file(path: str, download_name: Optional[str] = None):
+    """Send a file from a generation directory with ETag, conditional and Range support."""
+    response = send_file(os.path.abspath(path), download_name=download_name, as_attachment=True,
+                         etag=file_etag(path), conditional=True,
+                         max_age=current_app.config['OUTPUT_CACHE_MAX_AGE'])
+    return cache_privately(response)
+
+
+class LocalStorage:
+    """
+    Generation artifacts stored as files under one directory per generation.
+
+    Artifacts moved to the cold tier by the retention job are stored compressed
+    (name.zst or name.gz) and are decompressed transparently on read.
+    """
+
+    is_local = True
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, generation_id: str, name: str) -> str:
+        return os.path.join(resolve_generation_dir(self.root, generation_id), name)
+
+    def _locate(self, generation_id: str, name: str) -> Tuple[Optional[str], bool]:
+        """Return (path, is_cold) of the stored artifact, or (None, False) if missing."""
+        path = self.path(generation_id, name)
+        if os.path.isfile(path):
+            return path, False
+        for suffix in COLD_SUFFIXES:
+            if os.path.isfile(path + suffix):
+                return path + suffix, True
+        return None, False
+
+    def save(self, generation_id: str, name: str, local_path: str) -> None:
+        """Store a file; a no-op when it was already written in place."""
+        path = self.path(generation_id, name)
+        if os.path.abspath(local_path) != os.path.abspath(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(local_path, path)
+
+    def exists(self, generation_id: str, name: str) -> bool:
+        return self._locate(generation_id, name)[0] is not None
+
+    def read(self, generation_id: str, name: str) -> Optional[bytes]:
+        path, cold = self._locate(generation_id, name)
+        if path is None:
+            return None
+        try:
+            with (open_cold(path) if cold else open(path, "rb")) as f:
+                return f.read()
+        except FileNotFoundError:
+            # Moved to the cold tier between locating and opening it
+            return self.read(generation_id, name) if not cold else None
+
+    def iter_chunks(self, generation_id: str, name: str) -> Optional[Iterator[bytes]]:
+        path, cold = self._locate(generation_id, name)
+        if path is None:
+            return None
+
+        def chunks():
+            with (open_cold(path) if cold else open(path, "rb")) as f:
+                while True:
+                    chunk = f.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        return chunks()
+
+    def send(self, generation_id: str, name: str, download_name: Optional[str] = None):
+        """Send a stored file with ETag and Range support; None if it does not exist."""
+        path, cold = self._locate(generation_id, name)
+        if path is None:
+            return None
+        if not cold:
+            return send_generated_file(path, download_name or name)
+
+        # Cold artifacts are decompressed into memory; they are rarely requested
+        with open_cold(path) as f:
+            data = f.read()
+        response = send_file(io.BytesIO(data), download_name=download_name or name, as_attachment=True,
+                             etag=file_etag(path), conditional=True,
+                             max_age=current_app.config['OUTPUT_CACHE_MAX_AGE'])
+        return cache_privately(response)
+
+
+class S3Storage:
+    """
+    Generation artifacts stored as objects in an S3-compatible bucket.
+
+    Uploads use multipart transfers above multipart_threshold. Downloads redirect
+    the client to a presigned URL, so the app never proxies the object bytes.
+    endpoint_url points the client at a non-AWS service (MinIO, moto server, ...).
+    """
+
+    is_local = False
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, presign_expires: int = 300,
+                 multipart_threshold: int = 8 * 1024 * 1024, multipart_chunksize: int = 8 * 1024 * 1024):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires the boto3 package")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.presign_expires = presign_expires
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize)
+
+    def key(self, generation_id: str, name: str) -> str:
+        return "/".join(part for part in (self.prefix, generation_id, name) if part)
+
+    def save(self, generation_id: str, name: str, local_path: str) -> None:
+        self.client.upload_file(local_path, self.bucket, self.key(generation_id, name),
+                                Config=self.transfer_config)
+
+    def _get(self, generation_id: str, name: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.key(generation_id, name))
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def exists(self, generation_id: str, name: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(generation_id, name))
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+
+    def read(self, generation_id: str, name: str) -> Optional[bytes]:
+        response = self._get(generation_id, name)
+        return response["Body"].read() if response else None
+
+    def iter_chunks(self, generation_id: str, name: str) -> Optional[Iterator[bytes]]:
+        response = self._get(generation_id, name)
+        return response["Body"].iter_chunks(STREAM_CHUNK_SIZE) if response else None
+
+    def send(self, generation_id: str, name: str, download_name: Optional[str] = None):
+        """Redirect to a presigned URL for the object; None if it does not exist."""
+        if not self.exists(generation_id, name):
+            return None
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.key(generation_id, name),
+                "ResponseContentDisposition": f'attachment; filename="{download_name or name}"'
+            },
+            ExpiresIn=self.presign_expires
+        )
+        return redirect(url, code=302)
+
+
+def create_storage(config) -> "LocalStorage | S3Storage":
+    """Build the storage backend selected by STORAGE_BACKEND."""
+    backend = config.get('STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalStorage(config['OUTPUT_FOLDER'])
+    if backend == 's3':
+        return S3Storage(
+            config['S3_BUCKET'],
+            prefix=config.get('S3_PREFIX', ''),
+            endpoint_url=config.get('S3_ENDPOINT_URL'),
+            region=config.get('S3_REGION'),
+            presign_expires=config.get('S3_PRESIGN_EXPIRES', 300),
+            multipart_threshold=config.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024),
+            multipart_chunksize=config.get('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024)
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def init_storage(app) -> None:
+    """Create the application's storage backend."""
+    app.extensions['storage'] = create_storage(app.config)
+    logger.info("Using %s storage for generation artifacts", app.config.get('STORAGE_BACKEND', 'local'))
+
+
+def get_storage():
+    """Storage backend of the current application."""
+    return current_app.extensions['storage']
@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, User, SubscriptionPlan, PaymentHistory
+import queries
+from api_key_cache import invalidate_user_keys
 import stripe
 from datetime import datetime, timedelta
 import json
@@ -98,7 +100,7 @@ def success():
         current_user.subscription_expiry = datetime.utcnow() + timedelta(days=30)  # 30-day subscription
         
         # Reset usage counters
-        current_user.monthly_generations = 0
+        current_user.reset_monthly_generations()
         
         # Record payment
         payment = PaymentHistory(
@@ -111,6 +113,7 @@ def success():
         
         db.session.add(payment)
         db.session.commit()
+        invalidate_user_keys(current_user.id)
         
         flash(f'You have successfully subscribed to the {plan_name.capitalize()} plan!', 'success')
         return redirect(url_for('dashboard.index'))
@@ -147,6 +150,7 @@ def cancel():
         # Update user record
         current_user.subscription_status = 'canceled'
         db.session.commit()
+        invalidate_user_keys(current_user.id)
         
         flash('Your subscription has been canceled and will end at the current billing period.', 'info')
         return redirect(url_for('dashboard.subscription'))
@@ -190,7 +194,7 @@ def webhook():
 def handle_payment_succeeded(invoice):
     """Process successful subscription payment"""
     stripe_customer_id = invoice.get('customer')
-    user = User.query.filter_by(stripe_customer_id=stripe_customer_id).first()
+    user = queries.user_by_stripe_customer(stripe_customer_id).first()
     
     if not user:
         current_app.logger.error(f"Payment succeeded for unknown customer: {stripe_customer_id}")
@@ -221,13 +225,14 @@ def handle_payment_succeeded(invoice):
     
     db.session.add(payment)
     db.session.commit()
+    invalidate_user_keys(user.id)
     current_app.logger.info(f"Payment succeeded for user {user.id}, plan {plan_name}")
 
 
 def handle_payment_failed(invoice):
     """Process failed subscription payment"""
     stripe_customer_id = invoice.get('customer')
-    user = User.query.filter_by(stripe_customer_id=stripe_customer_id).first()
+    user = queries.user_by_stripe_customer(stripe_customer_id).first()
     
     if not user:
         current_app.logger.error(f"Payment failed for unknown customer: {stripe_customer_id}")
@@ -247,13 +252,14 @@ def handle_payment_failed(invoice):
     
     db.session.add(payment)
     db.session.commit()
+    invalidate_user_keys(user.id)
     current_app.logger.info(f"Payment failed for user {user.id}")
 
 
 def handle_subscription_deleted(subscription):
     """Process subscription cancellation/expiration"""
     stripe_customer_id = subscription.get('customer')
-    user = User.query.filter_by(stripe_customer_id=stripe_customer_id).first()
+    user = queries.user_by_stripe_customer(stripe_customer_id).first()
     
     if not user:
         current_app.logger.error(f"Subscription deleted for unknown customer: {stripe_customer_id}")
@@ -265,6 +271,7 @@ def handle_subscription_deleted(subscription):
     user.subscription_expiry = None
     
     db.session.commit()
+    invalidate_user_keys(user.id)
     current_app.logger.info(f"Subscription ended for user {user.id}")
 
 
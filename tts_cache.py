@@ -0,0 +1,173 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Callable
+
+from generate_voiceover import AUDIO_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# Recency of an entry is recorded on a sidecar file: the entry itself is hardlinked
+# into generation directories, so touching it would change their mtimes (and so their
+# ETags and retention age) too
+USED_SUFFIX = ".used"
+
+
+class AudioStore:
+    """
+    Content-addressed store of synthesized voiceover audio.
+
+    Audio is keyed by a hash of (text, language, codec, format), so identical requests
+    are served from disk. Generation directories receive a hardlink to the stored file
+    (or a copy when hardlinks are not possible), so stored files are never modified;
+    the last use of each entry is tracked by the mtime of a sidecar file. The least
+    recently used entries are evicted once the store grows past max_bytes.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def make_key(text: str, language: str, codec: str, audio_format: str = AUDIO_FORMAT) -> str:
+        payload = json.dumps([text, language, codec.upper(), audio_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, codec: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{codec.lower()}")
+
+    def _entries(self):
+        """(path, size, last used) of every stored entry."""
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                # Skip sidecars, and files other threads are still synthesizing
+                if filename.endswith((USED_SUFFIX, ".tmp")):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                try:
+                    used = os.stat(path + USED_SUFFIX).st_mtime
+                except FileNotFoundError:
+                    used = 0
+                yield path, stat.st_size, max(stat.st_mtime, used)
+
+    @staticmethod
+    def _mark_used(path: str) -> None:
+        with open(path + USED_SUFFIX, "a"):
+            pass
+        os.utime(path + USED_SUFFIX)
+
+    @staticmethod
+    def _link(source: str, destination: str) -> None:
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except OSError:
+            # Different filesystem or no hardlink support
+            shutil.copyfile(source, destination)
+
+    def fetch(self, text: str, language: str, codec: str, output_file: str,
+              synthesize: Callable[[str], None]) -> bool:
+        """
+        Place the audio for text at output_file, calling synthesize(path) only on a miss.
+
+        Returns:
+            bool: True if the audio came from the store.
+        """
+        key = self.make_key(text, language, codec)
+        path = self._path(key, codec)
+
+        if os.path.exists(path):
+            self._mark_used(path)
+            self._link(path, output_file)
+            with self._lock:
+                self.hits += 1
+            return True
+
+        with self._lock:
+            self.misses += 1
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            synthesize(tmp_path)
+            if os.path.getsize(tmp_path) == 0:
+                # Synthesis failed; leave nothing behind so the next call retries
+                return False
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._link(path, output_file)
+        with self._lock:
+            self._total_bytes += os.path.getsize(path)
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+        return False
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            try:
+                os.remove(path + USED_SUFFIX)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+        with self._lock:
+            self._total_bytes = total
+        logger.info("TTS cache evicted down to %d bytes", total)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_audio_store() -> AudioStore:
+    """Return the process-wide TTS audio store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AudioStore(
+                    os.getenv("TTS_CACHE_DIR", "tts_cache"),
+                    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+                )
+    return _store